@@ -1,10 +1,22 @@
+import hashlib
+import hmac
 import os
-import pandas as pd
-from flask import Flask, request, send_file, render_template
+import shutil
+import time
+import uuid
+from flask import Flask, request, send_file, send_from_directory, render_template, jsonify, url_for, g, Response
 from werkzeug.utils import secure_filename
 from datetime import datetime
-from openpyxl import load_workbook
-from openpyxl.styles import Font, Alignment, Border, Side
+from jobs import JobQueue, MAX_JOBS, DONE
+from result_cache import ResultCache, cache_key, batch_key
+from frame_cache import FrameCache
+from storage import StorageManager
+from watch_folder import OUTBOX_FOLDER, read_index
+from metrics import MetricsRegistry, METRICS_FOLDER
+from stage_timing import add_stage_observer
+from profiling import profile_call, PROFILE_TEXT, PROFILE_STATS
+from pick_list_stream import is_large_report
+from order_ledger import OrderLedger, LEDGER_PATH
 
 app = Flask(__name__)
 
@@ -12,9 +24,246 @@ app = Flask(__name__)
 UPLOAD_FOLDER = 'uploads'
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
-# Create the upload directory if it doesn't exist
-if not os.path.exists(UPLOAD_FOLDER):
-    os.makedirs(UPLOAD_FOLDER)
+# Each upload is processed as a background job in its own directory under uploads/jobs
+JOBS_FOLDER = os.path.join(UPLOAD_FOLDER, 'jobs')
+app.config['MAX_JOBS'] = MAX_JOBS
+
+# Uploads are copied here while they arrive, then moved into their job's directory
+INCOMING_FOLDER = os.path.join(UPLOAD_FOLDER, 'incoming')
+
+# Uploads are copied and hashed this many bytes at a time
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+
+# Create the upload directories if they don't exist
+for folder in (JOBS_FOLDER, INCOMING_FOLDER):
+    os.makedirs(folder, exist_ok=True)
+
+# Request, job and stage counts and timings of this process, served by /metrics together
+# with those of the other worker processes
+metrics = MetricsRegistry(METRICS_FOLDER)
+add_stage_observer(metrics.observe_stage)
+
+
+def count_job(job):
+    # Called by the job queue for every job that ends
+    metrics.inc('pick_list_jobs_total', status=job['status'])
+    metrics.maybe_flush()
+
+
+job_queue = JobQueue(JOBS_FOLDER, app.config['MAX_JOBS'], on_finish=count_job)
+
+# Jobs left queued or running by processes that exited (e.g. before a restart) are marked failed
+job_queue.recover()
+
+# Servers that do not preload the app can load the pipeline at start-up instead of on the first upload
+if os.environ.get('PICK_LIST_WARM_UP') == '1':
+    from pick_list import warm_up
+    warm_up()
+
+# Workbooks already generated, by upload content and mapping version, under uploads/cache
+CACHE_FOLDER = os.path.join(UPLOAD_FOLDER, 'cache')
+result_cache = ResultCache(CACHE_FOLDER)
+
+# Parsed order lines of each distinct upload, so a pick list can be regenerated without re-reading the report
+FRAMES_FOLDER = os.path.join(UPLOAD_FOLDER, 'frames')
+frame_cache = FrameCache(FRAMES_FOLDER)
+
+# Pick lists pre-built by the inbox watcher (watch_folder.py)
+app.config['OUTBOX_FOLDER'] = OUTBOX_FOLDER
+
+# Retention and size cap for everything under the upload folder, swept in the background
+storage = StorageManager(UPLOAD_FOLDER, in_use=job_queue.in_use)
+
+# Order lines already put on a pick list, for "only new order lines" uploads
+ledger = OrderLedger(LEDGER_PATH)
+
+# Admins (the PICK_LIST_ADMIN_TOKEN value in an X-Admin-Token header or admin_token
+# parameter) can have an upload profiled with ?profile=1; without the setting nobody can
+app.config['ADMIN_TOKEN'] = os.environ.get('PICK_LIST_ADMIN_TOKEN')
+
+
+def is_admin():
+    token = request.headers.get('X-Admin-Token') or request.args.get('admin_token')
+    admin_token = app.config['ADMIN_TOKEN']
+    return bool(admin_token) and token is not None and hmac.compare_digest(token, admin_token)
+
+
+def job_status(job):
+    # The job record plus the URLs the upload page polls and downloads from
+    status = dict(job)
+    status['status_url'] = url_for('get_job', job_id=job['id'])
+    status['download_url'] = url_for('download_job', job_id=job['id'])
+    if job.get('profile'):
+        status['profile_url'] = url_for('download_profile', job_id=job['id'])
+    return status
+
+
+def build_and_cache(key, source_key, named_sources, output_filepath, *args, fresh=False, new_only=False):
+    # Build the pick list from the cached order lines when there are any (unless fresh),
+    # otherwise read the reports ((name, path) pairs, several in parallel),
+    # merge them and cache the order lines; then keep a copy of the workbook. A single
+    # report over the streaming threshold is read in chunks instead, within a fixed memory budget.
+    # Every line built is recorded in the ledger; with new_only the lines already on an
+    # earlier pick list are left out, and the workbook (which depends on the ledger) is not cached.
+    # The pipeline (pandas, openpyxl) is imported here, so the app starts without it.
+    from pick_list import build_pick_list
+    from pick_list_stream import build_pick_list_stream
+
+    if len(named_sources) == 1 and is_large_report(named_sources[0][1]):
+        with ledger.run() as run:
+            result = build_pick_list_stream(named_sources[0][1], output_filepath, *args,
+                                            line_filter=lambda df: run.add(df, new_only))
+        return cache_result(None if new_only else key, output_filepath, ledger_result(result, run, new_only))
+
+    df = load_order_lines(source_key, named_sources, fresh)
+    with ledger.run() as run:
+        result = build_pick_list(run.add(df, new_only), output_filepath, *args)
+    return cache_result(None if new_only else key, output_filepath, ledger_result(result, run, new_only))
+
+
+def load_order_lines(source_key, named_sources, fresh=False):
+    # The order lines of the reports: cached ones (unless fresh), or the reports read
+    # (several in parallel), merged and cached
+    from order_report import read_many_order_lines, merge_order_lines
+    df = None if fresh else frame_cache.get(source_key)
+    if frame_cache.enabled and not fresh:
+        metrics.inc('pick_list_cache_lookups_total', cache='frame', result='miss' if df is None else 'hit')
+    if df is None:
+        frames = read_many_order_lines(named_sources)
+        for (name, _), frame in zip(named_sources, frames):
+            print(f"Read {len(frame)} order lines from {name}")
+        if len(frames) == 1:
+            df = frames[0]
+        else:
+            df = merge_order_lines(frames)
+            print(f"Merged {len(frames)} reports into {len(df)} order lines")
+        frame_cache.put(source_key, df)
+    return df
+
+
+def serve_cached(cached, key, source_key, named_sources, output_filepath, *args):
+    # Hand out a workbook from the result cache and record its order lines in the ledger,
+    # like a build would (from the cached order lines, or the report read again in chunks
+    # when it is large). A workbook evicted in the meantime is built again.
+    from order_report import read_order_line_chunks
+    from pick_list_stream import chunk_lines_for, STREAM_MEMORY_MB
+    try:
+        shutil.copyfile(cached, output_filepath)
+    except FileNotFoundError:
+        return build_and_cache(key, source_key, named_sources, output_filepath, *args)
+    with ledger.run() as run:
+        if len(named_sources) == 1 and is_large_report(named_sources[0][1]):
+            for df in read_order_line_chunks(named_sources[0][1], chunk_lines_for(STREAM_MEMORY_MB)):
+                run.add(df)
+        else:
+            run.add(load_order_lines(source_key, named_sources))
+    return {'cached': True}
+
+
+def ledger_result(result, run, new_only):
+    # An "only new" job reports how many order lines were left out
+    if new_only:
+        result['skipped_lines'] = run.known_lines
+        metrics.inc('pick_list_skipped_lines_total', run.known_lines)
+    return result
+
+
+def cache_result(key, output_filepath, result):
+    # Keep a copy of a newly built workbook (unless key is None) and count it
+    if key is not None:
+        result_cache.put(key, output_filepath)
+    metrics.inc('pick_list_order_lines_total', result['order_lines'])
+    metrics.inc('pick_list_pick_lines_total', result['pick_lines'])
+    metrics.inc('pick_list_bytes_out_total', os.path.getsize(output_filepath))
+    return result
+
+
+def save_upload(file):
+    # Copy an uploaded file to a .tmp file in the incoming folder a chunk at a time, hashing
+    # it on the way, so no upload is ever held in memory whole; returns its path, content
+    # key and size
+    digest = hashlib.sha256()
+    size = 0
+    path = os.path.join(INCOMING_FOLDER, f'{uuid.uuid4().hex}.tmp')
+    with open(path, 'wb') as f:
+        for chunk in iter(lambda: file.stream.read(UPLOAD_CHUNK_BYTES), b''):
+            digest.update(chunk)
+            f.write(chunk)
+            size += len(chunk)
+    return path, digest.hexdigest(), size
+
+
+def start_job(source_key, filenames, filepaths, today, group_by, consolidated, uploads=None, profile=False,
+              new_only=False):
+    # Create a job for one or more uploads (uploads holds the paths save_upload copied them
+    # to) or for stored reports at filepaths. When the workbook is already cached, the job
+    # only copies it and records its order lines in the ledger.
+    # A profiled job skips the caches and runs the whole pipeline under the profiler;
+    # a new_only job only has the order lines not on an earlier pick list.
+    from style_mapping import get_mappings
+    key = cache_key(source_key, get_mappings().key, today, group_by, consolidated)
+    job = job_queue.create(
+        filename=', '.join(filenames),
+        files=filenames,
+        today=today,
+        group_by=group_by,
+        consolidated=consolidated,
+        source_key=source_key,
+        cache_key=key,
+        profile=profile,
+        new_only=new_only,
+    )
+    job_dir = job_queue.job_dir(job['id'])
+    output_filepath = os.path.join(job_dir, 'output.xlsx')
+
+    # Keep the uploads next to the job, they are the source for regenerating the pick list later
+    if uploads is not None:
+        filepaths = []
+        for i, (filename, upload_path) in enumerate(zip(filenames, uploads)):
+            filename = filename or 'upload'
+            filepath = os.path.join(job_dir, f'{i + 1}-{filename}' if len(uploads) > 1 else filename)
+            os.replace(upload_path, filepath)
+            filepaths.append(filepath)
+    job['sources'] = filepaths
+
+    # The pick list is built on a worker thread from the stored reports; a single one large
+    # enough is streamed from its file
+    named_sources = list(zip(filenames, filepaths))
+
+    # Repeat upload: hand out the stored workbook without building it again
+    use_cache = not (profile or new_only)
+    cached = result_cache.get(key) if use_cache else None
+    if use_cache:
+        metrics.inc('pick_list_cache_lookups_total', cache='result', result='miss' if cached is None else 'hit')
+    if cached is not None:
+        job_queue.submit(job, serve_cached, cached, key, source_key, named_sources, output_filepath,
+                         today, group_by, consolidated)
+    elif profile:
+        job_queue.submit(job, profile_call, job_dir, build_and_cache, key, source_key, named_sources,
+                         output_filepath, today, group_by, consolidated, fresh=True, new_only=new_only)
+    else:
+        job_queue.submit(job, build_and_cache, key, source_key, named_sources, output_filepath,
+                         today, group_by, consolidated, new_only=new_only)
+    return job, 202
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.before_request
+def start_storage_sweep():
+    # Started with the first request rather than at import, so pre-forked workers each run one
+    storage.start()
+
+@app.after_request
+def count_request(response):
+    # Every request is timed and counted by endpoint; this process's counts are written out
+    # every few seconds, not on every request
+    endpoint = request.endpoint or 'unknown'
+    metrics.observe('pick_list_request_seconds', time.perf_counter() - g.request_started, endpoint=endpoint)
+    metrics.inc('pick_list_requests_total', endpoint=endpoint, status=response.status_code)
+    metrics.maybe_flush()
+    return response
 
 @app.route('/')
 def index():
@@ -23,410 +272,133 @@ def index():
 @app.route('/upload', methods=['POST'])
 def upload_file():
     if 'file' not in request.files:
-        return "No file part"
+        return "No file part", 400
     
-    file = request.files['file']
+    # Several reports (e.g. morning/afternoon or several seller accounts) make one pick list
+    files = [file for file in request.files.getlist('file') if file.filename != '']
 
-    if file.filename == '':
-        return "No selected file"
+    if not files:
+        return "No selected file", 400
     
-    if file:
-        filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
-
-        # Process the Excel file
-        df = pd.read_excel(filepath)
-
-        # Print the columns to check names
-        print("All COLUMNS in the uploaded file:", df.columns.tolist())
-
-        # Specify the columns you want to delete for the first layout
-        columns_to_delete_first_layout = ['order-item-id', 'purchase-date', 'payments-date', 'reporting-date', 'promise-date', 'days-past-promise', 
-                             'buyer-email', 'buyer-name', 'payment-method-details', 'cpf', 'buyer-phone-number', 'number-of-items', 
-                             'product-name', 'quantity-shipped', 'quantity-to-ship', 'ship-service-level', 'ship-service-name', 
-                             'ship-address-1', 'ship-address-2', 'ship-address-3', 'address-type', 'ship-city', 'ship-state', 
-                             'ship-postal-code', 'ship-country', 'gift-wrap-type', 'gift-message-text', 'payment-method', 
-                             'cod-collectible-amount', 'already-paid', 'payment-method-fee', 'customized-url', 'customized-page', 
-                             'is-business-order', 'purchase-order-number', 'price-designation', 'is-prime', 'is-global-express', 
-                             'is-premium-order', 'buyer-company-name', 'licensee-name', 'license-number', 'license-state', 
-                             'license-expiration-date', 'is-replacement-order', 'is-exchange-order', 'original-order-id', 
-                             'is-transparency', 'default-ship-from-address-name', 'default-ship-from-address-field-1', 
-                             'default-ship-from-address-field-2', 'default-ship-from-address-field-3', 'default-ship-from-city', 
-                             'default-ship-from-state', 'default-ship-from-country', 'default-ship-from-postal-code', 
-                             'is-ispu-order', 'store-chain-store-id', 'is-buyer-requested-cancellation', 
-                             'buyer-requested-cancel-reason', 'ioss-number', 'is-shipping-settings-automation-enabled', 
-                             'ssa-carrier', 'ssa-ship-method', 'tax-collection-model', 'tax-collection-responsible-party', 
-                             'verge-of-cancellation', 'verge-of-lateShipment', 'signature-confirmation-recommended']
-
-        # Delete the specified columns for the first layout if they exist
-        for column in columns_to_delete_first_layout:
-            if column in df.columns:
-                df.drop(columns=[column], inplace=True)
-                print(f"Deleted column: {column}")
-            else:
-                print(f"Column '{column}' not found. No column deleted.")
-
-        # Specify the desired order of columns for the first layout
-        new_order_first_layout = [
-            'order-id', 
-            'recipient-name', 
-            'sku', 
-            'quantity-purchased',  # This will be changed to 'QTY' below
-        ]
-
-        # Reorder the DataFrame for the first layout
-        df_first_layout = df[new_order_first_layout]
-        
-        # Change 'quantity-purchased' to 'QTY'
-        df_first_layout.rename(columns={'quantity-purchased': 'Qty'}, inplace=True)
-
-        print(f"Re-Arranged Column Ordering for First Layout")
+    if files:
+        filenames = [secure_filename(file.filename) for file in files]
 
         # Get the current date
         today = datetime.now().strftime("%Y%m%d")  # Format: YYYY-MM-DD
 
-        # Create the output file path with today's date
-        output_filepath = os.path.join(app.config['UPLOAD_FOLDER'], f'{today} - Amazon Order Report.xlsx')
-        
-        # Save the first layout to the output file
-        df_first_layout.to_excel(output_filepath, index=False, sheet_name=today)
-
-        # Load the workbook to create the second layout
-        wb = load_workbook(output_filepath)
-        
-        # Create the first sheet
-        ws1 = wb[today]
-        
-        # Define the border style for Layout 1
-        thin_border = Border(left=Side(style='thin'), right=Side(style='thin'), 
-                             top=Side(style='thin'), bottom=Side(style='thin'))
-
-        # Apply font style to header cells with size 14
-        for c in range(1, df_first_layout.shape[1] + 1):
-            cell = ws1.cell(row=1, column=c)
-            cell.font = Font(color="FF0000", bold=True, size=14)  # Red bold font, size 14 for the header
-            cell.border = thin_border  # Add border to header
-            cell.alignment = Alignment(horizontal='center')  # Center align header
-
-        # Apply borders, formatting, and font size 14 to data cells in Layout 1 and center everything
-        for r_idx in range(2, df_first_layout.shape[0] + 2):  # Starting from row 2
-            for c_idx in range(1, df_first_layout.shape[1] + 1):
-                cell = ws1.cell(row=r_idx, column=c_idx)
-                cell.font = Font(size=14)  # Font size 14 for the data cells
-                cell.border = thin_border  # Add border to data cells
-                cell.alignment = Alignment(horizontal='center')  # Center align data
-
-        # Set the width of columns in Layout 1
-        column_widths_layout_1 = {
-            1: 30,  # Width for 'order-id'
-            2: 30,  # Width for 'recipient-name'
-            3: 30,  # Width for 'sku'
-            4: 10   # Width for 'QTY'
-        }
-
-        for col, width in column_widths_layout_1.items():
-            ws1.column_dimensions[ws1.cell(row=1, column=col).column_letter].width = width
-
-        # Calculate the total of the 'Qty' column
-        total_qty = df_first_layout['Qty'].sum()
-
-        # Determine the next available row for total
-        next_row = df_first_layout.shape[0] + 2  # +2 to account for header and data rows
-
-        # Write the total in the appropriate cells
-        ws1.cell(row=next_row, column=3, value="Total")  # Column C
-        ws1.cell(row=next_row, column=4, value=total_qty)  # Column D
-
-        # Format the "Total" row (e.g., bold font, border)
-        total_font = Font(bold=True, size=14)
-        for c in range(3, 5):  # Columns C and D
-            cell = ws1.cell(row=next_row, column=c)
-            cell.font = total_font  # Bold font, size 14 for the total row
-            cell.border = thin_border  # Add border to the total cells
-            cell.alignment = Alignment(horizontal='center')  # Center align total cells
-
-        # After creating the second layout (ws2)
-        ws2 = wb.create_sheet(title=f'{today}-')
-
-        # Process the DataFrame for the second layout
-        df_second_layout = df.copy()
-
-        # Delete specified columns for the second layout
-        df_second_layout.drop(columns=['order-id', 'recipient-name'], inplace=True)
-
-        # Split the 'sku' into separate columns, filling with None if there are fewer segments
-        sku_split = df_second_layout['sku'].str.split('-', expand=True)
-
-        # Assign to respective columns with safety checks
-        df_second_layout['Style'] = sku_split[0]  # First part
-        df_second_layout['Color'] = sku_split[1]  # Second part
-        df_second_layout['Size'] = sku_split[2]    # Third part
-        df_second_layout['Other'] = sku_split[3]   # Fourth part (after the third hyphen)
-
-        # Retain the required columns and remove the original 'sku' column
-        df_second_layout = df_second_layout[['Style', 'Color', 'Size', 'quantity-purchased', 'Other']]
-
-        # Rename 'quantity-purchased' to 'Qty'
-        df_second_layout.rename(columns={'quantity-purchased': 'Qty'}, inplace=True)
-
-        # Set the 'Other' column values to blank (for rows where it previously had 'BD')
-        df_second_layout['Other'] = ''
-
-        # Rename the last column to "Packs from #1 or No Inv."
-        df_second_layout.rename(columns={'Other': 'Packs from #1 or No Inv.'}, inplace=True)
-
-        # Sort the DataFrame first by 'Style', then by 'Color', and then by 'Size' within the same 'Style' and 'Color'
-        df_second_layout = df_second_layout.sort_values(by=['Style', 'Color', 'Size'], ascending=[True, True, True]).reset_index(drop=True)
-
-        # Create a new list to store the rows for the new sheet
-        new_rows = []
-        previous_style = None
-
-        # Iterate through the sorted DataFrame and add rows
-        for r_idx, row in df_second_layout.iterrows():
-            current_style = row['Style']
-            
-            # Check if the current style is different from the previous one
-            if previous_style is not None and current_style != previous_style:
-                # Add a blank row to create a newline
-                new_rows.append(['', '', '', '', ''])  # Empty row with same number of columns
-            
-            # Append the current row to the new_rows list
-            new_rows.append(row.tolist())
-            
-            # Update the previous_style for the next iteration
-            previous_style = current_style
-
-        # Write the new rows to the second sheet
-        for r_idx, row in enumerate(new_rows):
-            for c_idx, value in enumerate(row):
-                ws2.cell(row=r_idx + 2, column=c_idx + 1, value=value)
-
-        # Set headers with bold red font size 14 for the second layout
-        header_font = Font(color="FF0000", bold=True, size=14)  # Red color, bold, size 14
-        nonheader_font = Font(color="000000", bold=False, size=14)  # Non-header font style
-
-        for c in range(1, df_second_layout.shape[1] + 1):
-            cell = ws2.cell(row=1, column=c, value=df_second_layout.columns[c-1])
-            cell.font = header_font
-            cell.alignment = Alignment(horizontal='center')  # Center align header
-            cell.border = Border(left=Side(style='thin'), right=Side(style='thin'), 
-                                top=Side(style='thin'), bottom=Side(style='thin'))  # Add border to header cells
-
-        # Define the border style for Layout 2
-        thin_border = Border(left=Side(style='thin'), right=Side(style='thin'), 
-                            top=Side(style='thin'), bottom=Side(style='thin'))
-
-        # Apply borders and center alignment for data cells in Layout 2
-        for r_idx in range(2, len(new_rows) + 2):  # Starting from row 2
-            for c_idx in range(1, df_second_layout.shape[1] + 1):
-                cell = ws2.cell(row=r_idx, column=c_idx)
-                cell.font = nonheader_font
-                cell.alignment = Alignment(horizontal='center')  # Center align data
-                cell.border = thin_border  # Add border to data cells
-
-        # Set the width of columns in Layout 2
-        column_widths_layout_2 = {
-            1: 20,  # Width for 'Style'
-            2: 20,  # Width for 'Color'
-            3: 15,  # Width for 'Size'
-            4: 10,   # Width for 'QTY',
-            5: 45   # Width for 'Packs from #1 or No Inv.'            
-        }
-
-        for col, width in column_widths_layout_2.items():
-            ws2.column_dimensions[ws2.cell(row=1, column=col).column_letter].width = width
-
-        # Calculate the total for the 'Qty' column
-        total_qty = df_second_layout['Qty'].sum()
-
-        # Append the "Total" label and the total value
-        total_row_index = len(new_rows) + 2  # Adjust for header and data rows
-        ws2.cell(row=total_row_index, column=3, value="Total")  # "Total" in the third column
-        ws2.cell(row=total_row_index, column=4, value=total_qty)  # Total quantity in the fourth column
-
-        # Format the "Total" row (bold, size 14, and borders)
-        total_font = Font(bold=True, size=14)
-        for col in [3, 4]:  # Columns for "Total" and the count
-            cell = ws2.cell(row=total_row_index, column=col)
-            cell.font = total_font  # Bold font, size 14
-            cell.alignment = Alignment(horizontal='center')  # Center align the total cells
-            cell.border = thin_border  # Add border to the "Total" and quantity cells
-
-        # Center align the "Total" cell
-        ws2.cell(row=total_row_index, column=3).alignment = Alignment(horizontal='center')
-        ws2.cell(row=total_row_index, column=4).alignment = Alignment(horizontal='center')
-
-        # Create the third sheet
-        ws3 = wb.create_sheet(title='Fx5Reformatted')
-
-        # Process the DataFrame for the third layout
-        df_third_layout = df_second_layout.copy()  # Start from the second layout DataFrame
-
-        # Remove the 5th column ('Packs from #1 or No Inv.') to create the third layout
-        df_third_layout.drop(columns=['Packs from #1 or No Inv.'], inplace=True)
-
-        # Update the 'Style' column based on the conditions
-        def update_style(row):
-            style, size = row['Style'], row['Size']
-            
-            # Dictionary mapping original styles to their new values
-            style_mapping = {
-                'CB0536': 'CB0536',
-                'CO078': 'CO078M',
-                'CO078LEO': 'CO078Y/LEO',
-                'CO079': 'CO079M',
-                'CO129': 'CO129Y',
-                'CO129LEO': 'CO129Y/LEO',
-                'HB2122': 'HB2122',
-                'HB2137': 'HB2137',
-                'HB2137PL': 'HB2137PL222',
-                'HB3134': 'HB3134',
-                'HK8072': 'HK8072',
-                'HK8246': 'HK8246',
-                'HK8266': 'HK8266',
-                'HK8266': 'HK8266',
-                'KC003': 'KC003',
-                'KC009': 'KC009',
-                'MK0179': 'MK0179',
-                'MK3104': 'MK3104',
-                'MK3279': 'MK3279',
-                'MK3392': 'MK3392',
-                'MK3466': 'MK3466',
-                'MK3466': 'MK3466',
-                'MK3467': 'MK3467Y',
-                'MK3506': 'MK3506',
-                'MK3514': 'MK3514Y',
-                'MK3515': 'MK3515',
-                'MK3554': 'MK3554',
-                'MK3558': 'MK3558Y',
-                'MK3595': 'MK3595',
-                'MK3637': 'MK3637Y',
-                'MK3636': 'MK3636Y',
-                'MK3659': 'MK3659',
-                'MK3664': 'MK3664Y',
-                'MK3664LEO': 'MK3664Y/LEO',
-                'MK3673': 'MK3673',
-                'MK3675': 'MK3675',
-                'MK5178': 'MK5178',
-                'MK5500': 'MK5500',
-                'MK5502': 'MK5502',
-                'MK8015': 'MK8015',
-                'MK8080': 'MK8080',
-                'MK8144': 'MK8144',
-                'MK8213': 'MK8213',
-                'MK8236': 'MK8236',
-                'MK8558': 'MK8558Y',
-                'MK5501': 'MK5501',
-                'MK3664EMBO': 'MK3664EMBO',
-                'MK32004CAT': 'MK32004CAT',
-                'MK8281': 'MK8281',
-                'MK3399': 'MK3399',
-                'MK8143': 'MK8143',
-                'MK8268': 'MK8268',
-                'MK3349': 'MK3349',
-
-            }
-            # Update styles based on specific conditions
-            if style in ['CO129', 'CO078', 'CO079', 'HB2137', 'MK3514', 'MK3636', 'MK3558', 'MK3467', 'MK8558', 'MK3514KID', 'MK5178KID'] and size in ['1X', '2X', '3X', '4X']:
-                if style == 'CO129':
-                    return 'CO129PL222'
-                elif style == 'CO078':
-                    return 'CO078PL'
-                elif style == 'CO079':
-                    return 'CO079PL'
-                elif style == 'HB2137':
-                    return 'HB2137PL222'
-                elif style == 'MK3514':
-                    return 'MK3514PL'
-                elif style == 'MK3636':
-                    return 'MK3636Y'
-                elif style == 'MK3558':
-                    return 'MK3558Y'
-                elif style == 'MK3467':
-                    return 'MK3467Y'
-                elif style == 'MK8558':
-                    return 'MK8558Y'
-                elif style == 'MK3514KID':
-                    return 'MK3514KID'
-                elif style == 'MK5178KID':
-                    return 'MK5178KID'
-            
-            # Return the mapped style or the original style if no conditions are met
-            return style_mapping.get(style, style)
-        
-            # Example mapping for color changes
-            color_mapping = {
-                'OPL': 'OPAL',
-                'AQA': 'AQUA'
-            }
-
-            # Function to modify data for the third layout
-            def process_third_layout(data):
-                modified_data = []
-                
-                for row in data:
-                    # Check if the color is in the mapping dictionary
-                    if row['color'] in color_mapping:
-                        # Update the color based on the mapping
-                        row['color'] = color_mapping[row['color']]
-                    modified_data.append(row)
-                
-                return modified_data
-
-
-            # Update based on the size for the specified styles
-            # if style in style_mapping:
-            #     return style_mapping[style]
-
-            # Default return if no conditions are met
-            return style
-
-         # Apply the style update function
-        df_third_layout['Style'] = df_third_layout.apply(update_style, axis=1)
-
-
-
-
-
-        # Write the updated third layout to the new sheet
-        for r_idx, row in df_third_layout.iterrows():
-            for c_idx, value in enumerate(row):
-                ws3.cell(row=r_idx + 2, column=c_idx + 1, value=value)
-
-        # Set headers with bold red font size 14 for the third layout
-        for c in range(1, df_third_layout.shape[1] + 1):
-            cell = ws3.cell(row=1, column=c, value=df_third_layout.columns[c-1])
-            cell.font = header_font
-            cell.alignment = Alignment(horizontal='center')
-            cell.border = Border(left=Side(style='thin'), right=Side(style='thin'),
-                                 top=Side(style='thin'), bottom=Side(style='thin'))
-
-        # Apply borders and formatting to data cells in Layout 3
-        for r_idx in range(2, df_third_layout.shape[0] + 2):  # Starting from row 2
-            for c_idx in range(1, df_third_layout.shape[1] + 1):
-                cell = ws3.cell(row=r_idx, column=c_idx)
-                cell.font = nonheader_font
-                cell.alignment = Alignment(horizontal='center')
-                cell.border = thin_border
-
-        # Set the width of columns in Layout 3
-        column_widths_layout_3 = {
-            1: 20,  # Width for 'Style'
-            2: 15,  # Width for 'Color'
-            3: 15,  # Width for 'Size'
-            4: 10   # Width for 'Qty'
-        }
-
-        for col, width in column_widths_layout_3.items():
-            ws3.column_dimensions[ws3.cell(row=1, column=col).column_letter].width = width
-
-        # Save the workbook after all modifications
-        wb.save(output_filepath)
-
-        # Send the modified file back to the user
-        return send_file(output_filepath, as_attachment=True)
+        group_by = request.form.get('group_by', 'style')
+        consolidated = request.form.get('consolidated') == 'on'
+
+        # Only the order lines not already on an earlier pick list
+        new_only = request.form.get('new_only') == 'on'
+
+        # Profiling one upload is for admins only
+        profile = request.args.get('profile') == '1'
+        if profile and not is_admin():
+            return jsonify(error="Profiling needs an admin token"), 403
+
+        # The same reports with the same mappings and options give the same workbook. Each
+        # upload is copied to disk and hashed in chunks, and whether it is streamed is decided
+        # from its size on disk, so memory stays bounded however large it is.
+        saved = []
+        try:
+            for file in files:
+                saved.append(save_upload(file))
+            metrics.inc('pick_list_bytes_in_total', sum(size for _, _, size in saved))
+            source_key = batch_key([key for _, key, _ in saved])
+            job, status_code = start_job(source_key, filenames, None, today, group_by, consolidated,
+                                         [path for path, _, _ in saved], profile, new_only)
+        finally:
+            # Uploads not moved into a job (e.g. after an error) are not kept
+            for path, _, _ in saved:
+                if os.path.exists(path):
+                    os.remove(path)
+        return jsonify(job_status(job)), status_code
+
+@app.route('/jobs/<job_id>')
+def get_job(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify(error="Unknown job"), 404
+    return jsonify(job_status(job))
+
+@app.route('/jobs/<job_id>/download')
+def download_job(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return "Unknown job", 404
+    if job['status'] != DONE:
+        return f"Job is {job['status']}", 409
+
+    # Send the finished workbook back to the user under the usual dated name;
+    # downloading counts as a use for the storage sweep
+    output_filepath = os.path.join(job_queue.job_dir(job_id), 'output.xlsx')
+    os.utime(output_filepath)
+    return send_file(os.path.abspath(output_filepath), as_attachment=True,
+                     download_name=f"{job['today']} - Amazon Order Report.xlsx")
+
+@app.route('/jobs/<job_id>/profile')
+def download_profile(job_id):
+    # The profile of a profiled job: the readable summary, or ?format=prof for the raw
+    # cProfile stats (python -m pstats, snakeviz)
+    if not is_admin():
+        return "Profiles need an admin token", 403
+    job = job_queue.get(job_id)
+    if job is None or not job.get('profile'):
+        return "Unknown job", 404
+    name = PROFILE_STATS if request.args.get('format') == 'prof' else PROFILE_TEXT
+    profile_filepath = os.path.join(job_queue.job_dir(job_id), name)
+    if not os.path.exists(profile_filepath):
+        return f"Job is {job['status']}", 409
+    return send_file(os.path.abspath(profile_filepath), as_attachment=True, download_name=f'{job_id}-{name}')
+
+@app.route('/jobs/<job_id>/regenerate', methods=['POST'])
+def regenerate_job(job_id):
+    # Rebuild a previous upload's pick list with the current mappings, optionally with other
+    # options, from its cached order lines (or its stored report when they were evicted)
+    job = job_queue.get(job_id)
+    if job is None or not job.get('sources'):
+        return jsonify(error="Unknown job"), 404
+
+    today = datetime.now().strftime("%Y%m%d")
+    group_by = request.form.get('group_by', job['group_by'])
+    consolidated = request.form.get('consolidated', 'on' if job['consolidated'] else '') == 'on'
+    # A regenerated "only new" pick list would be empty, its lines are in the ledger by now
+    new_only = request.form.get('new_only') == 'on'
+    new_job, status_code = start_job(job['source_key'], job['files'], job['sources'],
+                                     today, group_by, consolidated, new_only=new_only)
+    return jsonify(job_status(new_job)), status_code
+
+@app.route('/outbox')
+def list_outbox():
+    # Pick lists the inbox watcher has already built, newest first
+    reports = sorted(read_index(app.config['OUTBOX_FOLDER']).values(), key=lambda report: report['created'], reverse=True)
+    for report in reports:
+        report['download_url'] = url_for('download_outbox', name=report['output'])
+    return jsonify(reports)
+
+@app.route('/outbox/<path:name>')
+def download_outbox(name):
+    return send_from_directory(os.path.abspath(app.config['OUTBOX_FOLDER']), name, as_attachment=True)
+
+@app.route('/cache')
+def cache_stats():
+    return jsonify(result_cache.stats())
+
+@app.route('/storage')
+def storage_stats():
+    return jsonify(storage.stats())
+
+@app.route('/ledger')
+def ledger_stats():
+    return jsonify(ledger.stats())
+
+@app.route('/metrics')
+def metrics_text():
+    # Prometheus text format, added up across all processes serving the app
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    # Development server only, with debug mode opt-in (FLASK_DEBUG=1); serve production
+    # traffic with gunicorn -c gunicorn.conf.py
+    app.run(debug=os.environ.get('FLASK_DEBUG') == '1')
\ No newline at end of file
@@ -0,0 +1,175 @@
+import argparse
+import glob
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+from datetime import datetime
+
+from stage_timing import add_stage_observer, remove_stage_observer
+
+APP_FOLDER = os.path.dirname(os.path.abspath(__file__))
+
+# Where each run's results are saved, one JSON file per run
+RESULTS_FOLDER = os.environ.get('PICK_LIST_BENCH_RESULTS', 'bench_results')
+
+# A stage this much slower (or faster) than in the previous run is flagged, unless the
+# difference is below the timer noise of a few milliseconds
+CHANGE_THRESHOLD = 0.10
+MIN_CHANGE_SECONDS = 0.005
+
+
+def run_pipeline(path, output, group_by, consolidated):
+    # One cold build: the parsed-SKU cache is emptied so every run parses the same work
+    from order_report import read_order_lines
+    from pick_list import build_pick_list
+    from sku_parser import sku_cache
+    sku_cache.clear()
+    df = read_order_lines(path)
+    return build_pick_list(df, output, '20240923', group_by, consolidated)
+
+
+def time_stages(path, repeat, group_by, consolidated):
+    # Median seconds per stage (and for the whole build) over repeat runs
+    runs = []
+    with tempfile.TemporaryDirectory() as scratch:
+        output = os.path.join(scratch, 'pick_list.xlsx')
+        for _ in range(repeat):
+            seconds = defaultdict(float)
+            observer = lambda name, elapsed: seconds.__setitem__(name, seconds[name] + elapsed)
+            add_stage_observer(observer)
+            started = time.perf_counter()
+            try:
+                result = run_pipeline(path, output, group_by, consolidated)
+            finally:
+                remove_stage_observer(observer)
+            seconds['total'] = time.perf_counter() - started
+            runs.append(seconds)
+    stages = list(runs[0])
+    return {name: statistics.median(run[name] for run in runs) for name in stages}, result
+
+
+def trace_stages(path, group_by, consolidated):
+    # Peak Python allocations (MB) inside each stage, from one traced run. Tracing slows
+    # the build down a lot, which is why the timings come from separate runs.
+    peaks = defaultdict(float)
+
+    def observer(name, elapsed):
+        peaks[name] = max(peaks[name], tracemalloc.get_traced_memory()[1] / (1024 * 1024))
+        tracemalloc.reset_peak()
+
+    with tempfile.TemporaryDirectory() as scratch:
+        add_stage_observer(observer)
+        tracemalloc.start()
+        try:
+            run_pipeline(path, os.path.join(scratch, 'pick_list.xlsx'), group_by, consolidated)
+            peaks['total'] = max(peaks.values(), default=0)
+        finally:
+            tracemalloc.stop()
+            remove_stage_observer(observer)
+    return dict(peaks)
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if platform.system() == 'Darwin' else peak / 1024
+
+
+def environment():
+    # What produced the numbers: the commit and the versions of the libraries doing the work
+    import numpy
+    import openpyxl
+    import pandas
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=APP_FOLDER, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'commit': commit,
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'python': platform.python_version(),
+        'pandas': pandas.__version__,
+        'numpy': numpy.__version__,
+        'openpyxl': openpyxl.__version__,
+    }
+
+
+def previous_results(folder):
+    paths = sorted(glob.glob(os.path.join(folder, 'bench-*.json')))
+    if not paths:
+        return None
+    with open(paths[-1], encoding='utf-8') as f:
+        return json.load(f)
+
+
+def compare(report, previous):
+    # Stage-by-stage change against the same report in the previous run
+    if previous is None:
+        return
+    before = next((r for r in previous['reports'] if r['report'] == report['report']), None)
+    if before is None:
+        return
+    print(f"  vs {previous['created']} ({previous.get('commit') or 'unknown commit'}):")
+    for name, seconds in report['seconds'].items():
+        old = before['seconds'].get(name)
+        if not old:
+            continue
+        change = seconds / old - 1
+        flag = ''
+        if abs(seconds - old) >= MIN_CHANGE_SECONDS and abs(change) > CHANGE_THRESHOLD:
+            flag = '  <-- slower' if change > 0 else '  <-- faster'
+        print(f"    {name:<16} {old:8.3f}s -> {seconds:8.3f}s  {change:+6.1%}{flag}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time and trace each stage of building a pick list")
+    parser.add_argument('reports', nargs='+', help="order reports, e.g. from generate_reports.py")
+    parser.add_argument('--repeat', type=int, default=3, help="timed runs per report")
+    parser.add_argument('--group-by', default='style')
+    parser.add_argument('--consolidated', action='store_true')
+    parser.add_argument('--no-memory', action='store_true', help="skip the traced run")
+    parser.add_argument('--results', default=RESULTS_FOLDER, help="folder for the results files")
+    args = parser.parse_args(argv)
+
+    previous = previous_results(args.results)
+    results = dict(environment(), repeat=args.repeat, group_by=args.group_by, consolidated=args.consolidated,
+                   reports=[])
+
+    for path in args.reports:
+        seconds, result = time_stages(path, args.repeat, args.group_by, args.consolidated)
+        peaks = {} if args.no_memory else trace_stages(path, args.group_by, args.consolidated)
+        report = {
+            'report': os.path.basename(path),
+            'bytes': os.path.getsize(path),
+            'order_lines': result['order_lines'],
+            'pick_lines': result['pick_lines'],
+            'seconds': {name: round(value, 4) for name, value in seconds.items()},
+            'peak_mb': {name: round(value, 1) for name, value in peaks.items()},
+        }
+        results['reports'].append(report)
+
+        print(f"{report['report']}: {report['order_lines']} order lines, {report['pick_lines']} pick lines")
+        for name, value in report['seconds'].items():
+            memory = f"  peak {report['peak_mb'][name]:8.1f} MB" if name in report['peak_mb'] else ''
+            print(f"  {name:<16} {value:8.3f}s{memory}")
+        compare(report, previous)
+
+    results['peak_rss_mb'] = round(peak_rss_mb(), 1)
+    os.makedirs(args.results, exist_ok=True)
+    path = os.path.join(args.results, f"bench-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=1)
+    print(f"Peak RSS {results['peak_rss_mb']} MB; results saved to {path}")
+
+
+if __name__ == '__main__':
+    main()
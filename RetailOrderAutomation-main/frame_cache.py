@@ -0,0 +1,85 @@
+import importlib.util
+import os
+import threading
+import time
+
+from order_report import ORDER_LINE_DTYPES
+
+# Arrow (Feather v2) support is optional; without pyarrow nothing is cached and
+# regenerating a pick list reads the original upload again. pyarrow is only
+# imported once a frame is actually stored or loaded.
+HAVE_PYARROW = importlib.util.find_spec('pyarrow') is not None
+
+# How long (in seconds) parsed order lines are kept after their last use
+FRAME_CACHE_MAX_AGE = float(os.environ.get('PICK_LIST_FRAME_CACHE_MAX_AGE', 30 * 24 * 3600))
+
+
+class FrameCache:
+    # Normalized order line frames as uncompressed Arrow files, one per distinct upload.
+    # Uncompressed files are memory-mapped on load, so the numeric and categorical
+    # columns come straight off the page cache instead of being parsed again.
+
+    def __init__(self, folder, max_age=FRAME_CACHE_MAX_AGE):
+        self.folder = folder
+        self.max_age = max_age
+        os.makedirs(folder, exist_ok=True)
+
+    @property
+    def enabled(self):
+        return HAVE_PYARROW
+
+    def path(self, key):
+        return os.path.join(self.folder, f'{key}.arrow')
+
+    def get(self, key):
+        # The cached frame for an upload, or None
+        if not self.enabled:
+            return None
+        import pyarrow.feather as feather
+        path = self.path(key)
+        try:
+            table = feather.read_table(path, memory_map=True)
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        # Same dtypes as a frame read from the report
+        return table.to_pandas().astype(ORDER_LINE_DTYPES)
+
+    def put(self, key, df):
+        # Store the frame unless it is already cached; columns Arrow cannot type
+        # (e.g. mixed numbers and text) are left to the original upload
+        if not self.enabled:
+            return None
+        import pyarrow as pa
+        import pyarrow.feather as feather
+        path = self.path(key)
+        if os.path.exists(path):
+            os.utime(path)
+            return path
+
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            feather.write_feather(df, tmp_path, compression='uncompressed')
+        except (pa.ArrowInvalid, pa.ArrowTypeError) as e:
+            print(f"Not caching order lines for {key[:12]}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return None
+        os.replace(tmp_path, path)
+        self.evict()
+        return path
+
+    def evict(self):
+        # Drop frames not used within max_age
+        now = time.time()
+        removed = 0
+        for entry in os.scandir(self.folder):
+            if not entry.name.endswith('.arrow'):
+                continue
+            try:
+                if now - entry.stat().st_mtime > self.max_age:
+                    os.remove(entry.path)
+                    removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
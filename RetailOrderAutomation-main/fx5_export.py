@@ -0,0 +1,50 @@
+from openpyxl import Workbook
+
+from pick_list_styles import HEADER, register_styles, style_range
+from sku_parser import parse_skus
+
+
+def build_fx5_export(df, output):
+    # Write the Fx5 style/color/size lines and the QuickBooks SKUs for a frame of order
+    # lines to output (a path or a file object) and return the row count
+
+    # Split each distinct SKU once (cached across requests) into Style, Color and Size, with the
+    # plus-size/base style, color and size (e.g. 'S/M' -> 'SM') mappings from mappings.json applied
+    sku_parts = parse_skus(df['sku'])
+    styles = sku_parts['Mapped Style'].tolist()
+    colors = sku_parts['Mapped Color'].tolist()
+    sizes = sku_parts['Mapped Size'].tolist()
+    quantities = df['quantity-purchased'].tolist()
+
+    # Malformed SKUs (fewer than three parts) are flagged instead of failing the upload
+    malformed = df.loc[sku_parts['Malformed'], 'sku']
+    if len(malformed):
+        print(f"Malformed SKUs: {malformed.astype(str).unique().tolist()}")
+
+    # Prepare the Excel file to be downloaded
+    wb = register_styles(Workbook())
+    ws1 = wb.active
+    ws1.title = "Fx5-Format-Change"
+
+    # Write the headers
+    headers = ['Style', 'Color', 'Size', 'Quantity']
+    ws1.append(headers)
+
+    # Apply the shared header style
+    style_range(ws1, HEADER, 1, 1, 1, 4)
+
+    # Write the data
+    for style, color, size, qty in zip(styles, colors, sizes, quantities):
+        ws1.append([style, color, size, qty])
+
+    ws2 = wb.create_sheet(title="Quickbook-SKU")
+    ws2.append(["SKU", "Qty"])  # Add headers for the second layout
+
+    for style, color, size, qty in zip(styles, colors, sizes, quantities):
+        sku = f"{style}-{color}-{size}"  # Concatenate Style, Color, Size
+        ws2.append([sku, qty])  # Append SKU and Qty
+
+    # Save the workbook
+    wb.save(output)
+
+    return {'order_lines': len(df)}
@@ -0,0 +1,180 @@
+import argparse
+import csv
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from style_mapping import get_mappings
+
+# Columns of Amazon's order report, as in the real reports in uploads/
+REPORT_HEADER = [
+    'order-id', 'order-item-id', 'purchase-date', 'payments-date', 'reporting-date', 'promise-date',
+    'days-past-promise', 'buyer-email', 'buyer-name', 'payment-method-details', 'cpf', 'buyer-phone-number',
+    'sku', 'number-of-items', 'product-name', 'quantity-purchased', 'quantity-shipped', 'quantity-to-ship',
+    'ship-service-level', 'ship-service-name', 'recipient-name', 'ship-address-1', 'ship-address-2',
+    'ship-address-3', 'address-type', 'ship-city', 'ship-state', 'ship-postal-code', 'ship-country',
+    'gift-wrap-type', 'gift-message-text', 'payment-method', 'cod-collectible-amount', 'already-paid',
+    'payment-method-fee', 'customized-url', 'customized-page', 'is-business-order', 'purchase-order-number',
+    'price-designation', 'is-prime', 'is-global-express', 'is-premium-order', 'buyer-company-name',
+    'licensee-name', 'license-number', 'license-state', 'license-expiration-date', 'is-replacement-order',
+    'is-exchange-order', 'original-order-id', 'is-transparency', 'default-ship-from-address-name',
+    'default-ship-from-address-field-1', 'default-ship-from-address-field-2',
+    'default-ship-from-address-field-3', 'default-ship-from-city', 'default-ship-from-state',
+    'default-ship-from-country', 'default-ship-from-postal-code', 'is-ispu-order', 'store-chain-store-id',
+    'is-buyer-requested-cancellation', 'buyer-requested-cancel-reason', 'ioss-number',
+    'is-shipping-settings-automation-enabled', 'ssa-carrier', 'ssa-ship-method', 'tax-collection-model',
+    'tax-collection-responsible-party', 'verge-of-cancellation', 'verge-of-lateShipment',
+    'signature-confirmation-recommended',
+]
+
+# Report sizes (order lines) and formats generated by default
+LINE_COUNTS = [1000, 10000, 100000, 1000000]
+FORMATS = ['tsv', 'xlsx']
+
+# Size mix of a typical day: every style sells S/M/L most, and styles with a
+# plus-size mapping also sell plus sizes
+REGULAR_SIZE_WEIGHTS = {'XS': 3, 'S': 24, 'M': 25, 'L': 23, 'XL': 15}
+PLUS_SIZE_WEIGHT = 13
+
+# Lines per order and quantity per line
+LINES_PER_ORDER_WEIGHTS = {1: 87, 2: 10, 3: 3}
+QUANTITY_WEIGHTS = {1: 90, 2: 8, 3: 2}
+
+# Made-up names and places; no customer data ends up in a generated report
+FIRST_NAMES = ['Alex', 'Jordan', 'Taylor', 'Morgan', 'Casey', 'Riley', 'Jamie', 'Avery', 'Quinn', 'Parker']
+LAST_NAMES = ['Smith', 'Lee', 'Garcia', 'Brown', 'Nguyen', 'Patel', 'Miller', 'Davis', 'Lopez', 'Clark']
+CITIES = [('SPRINGFIELD', 'IL'), ('RIVERSIDE', 'CA'), ('FRANKLIN', 'TN'), ('GREENVILLE', 'SC'),
+          ('MADISON', 'WI'), ('SALEM', 'OR'), ('CLINTON', 'NY'), ('FAIRVIEW', 'TX')]
+
+
+def weighted_choice(rng, weights, size):
+    # An array of size keys drawn from weights, each in proportion to its value
+    keys = list(weights)
+    p = np.array([weights[key] for key in keys], dtype=float)
+    return np.array(keys, dtype=object)[rng.choice(len(keys), size=size, p=p / p.sum())]
+
+
+def generate_skus(rng, n, mappings):
+    # STYLE-COLOR-SIZE-BD SKUs: styles and color codes come from the mapping tables, with a
+    # long-tailed style popularity and each style sold in its own handful of colors
+    styles = np.array(sorted(set(mappings.styles) | set(mappings.plus_size_styles)), dtype=object)
+    styles = styles[rng.permutation(len(styles))]
+    popularity = 1 / np.arange(1, len(styles) + 1) ** 1.1
+    style_index = rng.choice(len(styles), size=n, p=popularity / popularity.sum())
+
+    colors = np.array(sorted(mappings.colors), dtype=object)
+    colors_per_style = rng.integers(3, 13, size=len(styles))
+    style_colors = np.array([rng.choice(colors, size=12, replace=False) for _ in styles], dtype=object)
+    color_index = (rng.random(n) * colors_per_style[style_index]).astype(int)
+    line_colors = style_colors[style_index, color_index]
+
+    sizes = weighted_choice(rng, REGULAR_SIZE_WEIGHTS, n)
+    plus_sizes = np.array(mappings.plus_sizes, dtype=object)[rng.integers(0, len(mappings.plus_sizes), size=n)]
+    has_plus = np.isin(styles, list(mappings.plus_size_styles))[style_index]
+    use_plus = has_plus & (rng.random(n) < PLUS_SIZE_WEIGHT / 100)
+    sizes = np.where(use_plus, plus_sizes, sizes)
+
+    line_styles = styles[style_index]
+    skus = pd.Series(line_styles) + '-' + pd.Series(line_colors) + '-' + pd.Series(sizes) + '-BD'
+    return skus, line_styles, line_colors, sizes
+
+
+def generate_report(n, seed=0, mappings=None):
+    # A frame with REPORT_HEADER columns and n order lines
+    mappings = mappings or get_mappings()
+    rng = np.random.default_rng(seed)
+    skus, styles, colors, sizes = generate_skus(rng, n, mappings)
+
+    # Orders of one to three lines, each order shipping to one made-up person
+    lines_per_order = weighted_choice(rng, LINES_PER_ORDER_WEIGHTS, n).astype(int)
+    order_index = np.repeat(np.arange(n), lines_per_order)[:n]
+    order_count = order_index[-1] + 1 if n else 0
+    order_ids = (pd.Series(rng.integers(111, 115, size=order_count)).astype(str) + '-'
+                 + pd.Series(rng.integers(0, 10 ** 7, size=order_count)).astype(str).str.zfill(7) + '-'
+                 + pd.Series(rng.integers(0, 10 ** 7, size=order_count)).astype(str).str.zfill(7))
+    names = (pd.Series(np.array(FIRST_NAMES, dtype=object)[rng.integers(0, len(FIRST_NAMES), size=order_count)])
+             + ' ' + pd.Series(np.array(LAST_NAMES, dtype=object)[rng.integers(0, len(LAST_NAMES), size=order_count)]))
+    city_index = rng.integers(0, len(CITIES), size=order_count)
+    purchase = pd.Timestamp('2024-09-23T00:00:00Z') + pd.to_timedelta(rng.integers(0, 86400, size=order_count), unit='s')
+
+    quantity = weighted_choice(rng, QUANTITY_WEIGHTS, n).astype(int)
+    per_order = lambda values: np.asarray(values, dtype=object)[order_index]
+
+    columns = {column: np.full(n, '', dtype=object) for column in REPORT_HEADER}
+    columns.update({
+        'order-id': per_order(order_ids),
+        'order-item-id': rng.integers(10 ** 13, 10 ** 14, size=n),
+        'purchase-date': per_order(purchase.strftime('%Y-%m-%dT%H:%M:%S+00:00')),
+        'payments-date': per_order(purchase.strftime('%Y-%m-%dT%H:%M:%S+00:00')),
+        'reporting-date': per_order((purchase + pd.Timedelta(minutes=30)).strftime('%Y-%m-%dT%H:%M:%S+00:00')),
+        'promise-date': per_order((purchase + pd.Timedelta(days=3)).strftime('%Y-%m-%dT06:59:59+00:00')),
+        'days-past-promise': np.full(n, -3),
+        'buyer-email': per_order(pd.Series(order_ids).str.replace('-', '') + '@marketplace.example.com'),
+        'buyer-name': per_order(names),
+        'payment-method-details': np.full(n, 'Standard', dtype=object),
+        'sku': skus.to_numpy(dtype=object),
+        'number-of-items': quantity,
+        'product-name': (pd.Series(styles) + ' Knit Sweater - ' + pd.Series(colors) + ' - ' + pd.Series(sizes)).to_numpy(dtype=object),
+        'quantity-purchased': quantity,
+        'quantity-shipped': np.zeros(n, dtype=int),
+        'quantity-to-ship': quantity,
+        'ship-service-level': np.full(n, 'Standard', dtype=object),
+        'ship-service-name': np.full(n, 'Std US D2D Dom', dtype=object),
+        'recipient-name': per_order(names),
+        'ship-address-1': per_order(pd.Series(rng.integers(1, 9999, size=order_count)).astype(str) + ' MAIN ST'),
+        'address-type': np.full(n, 'Residential', dtype=object),
+        'ship-city': per_order([CITIES[i][0] for i in city_index]),
+        'ship-state': per_order([CITIES[i][1] for i in city_index]),
+        'ship-postal-code': per_order(pd.Series(rng.integers(10000, 99999, size=order_count)).astype(str)),
+        'ship-country': np.full(n, 'US', dtype=object),
+        'tax-collection-model': np.full(n, 'MarketplaceFacilitator', dtype=object),
+        'tax-collection-responsible-party': np.full(n, 'Amazon Services LLC', dtype=object),
+    })
+    for column in ('is-business-order', 'is-prime', 'is-global-express', 'is-premium-order',
+                   'is-replacement-order', 'is-exchange-order', 'is-transparency', 'is-ispu-order',
+                   'is-buyer-requested-cancellation', 'is-shipping-settings-automation-enabled',
+                   'verge-of-cancellation', 'verge-of-lateShipment', 'signature-confirmation-recommended'):
+        columns[column] = np.full(n, 'False', dtype=object)
+    return pd.DataFrame(columns, columns=REPORT_HEADER)
+
+
+def write_tsv(df, path):
+    # Amazon's flat file: tab-delimited, unquoted
+    df.to_csv(path, sep='\t', index=False, quoting=csv.QUOTE_NONE)
+
+
+def write_xlsx(df, path):
+    # Streamed through a write-only workbook; a million lines still takes several minutes
+    from openpyxl import Workbook
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append(list(df.columns))
+    for row in df.itertuples(index=False, name=None):
+        ws.append(row)
+    wb.save(path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate synthetic Amazon order reports for benchmarks")
+    parser.add_argument('-o', '--output-dir', default='bench_data')
+    parser.add_argument('--lines', type=int, nargs='+', default=LINE_COUNTS, help="order lines per report")
+    parser.add_argument('--formats', choices=FORMATS, nargs='+', default=FORMATS)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    writers = {'tsv': write_tsv, 'xlsx': write_xlsx}
+    extensions = {'tsv': 'txt', 'xlsx': 'xlsx'}
+    for n in args.lines:
+        df = generate_report(n, args.seed)
+        for report_format in args.formats:
+            path = os.path.join(args.output_dir, f'orders-{n}.{extensions[report_format]}')
+            started = time.perf_counter()
+            writers[report_format](df, path)
+            print(f"{path}: {n} lines, {os.path.getsize(path)} bytes in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+import os
+import resource
+
+# Production server for the pick list apps (gunicorn runs on Linux/macOS):
+#   gunicorn -c gunicorn.conf.py                  # Amazon pick list app, from this folder
+#   gunicorn -c ../../RetailOrderAutomation-main/gunicorn.conf.py script:app   # VLookUp app
+wsgi_app = 'AmazonExcelToPickList:app'
+bind = os.environ.get('PICK_LIST_BIND', '0.0.0.0:8000')
+
+# One pre-forked worker per core by default
+workers = int(os.environ.get('PICK_LIST_WORKERS', os.cpu_count() or 1))
+
+# Import the app (pandas, openpyxl, Flask) in the master and compile the mappings before
+# forking, so every worker starts ready and shares those pages copy-on-write
+preload_app = True
+
+# Recycle a worker after this many requests (jittered so they do not all restart together)
+# or once its resident memory passes the ceiling
+max_requests = int(os.environ.get('PICK_LIST_MAX_REQUESTS', 1000))
+max_requests_jitter = max(1, max_requests // 20)
+MAX_RSS_MB = int(os.environ.get('PICK_LIST_MAX_RSS_MB', 1024))
+
+# Big reports can take a while; a recycled worker also gets this long to finish its queued jobs.
+# Jobs of a worker that exits first (or is killed) are marked failed when next polled.
+timeout = int(os.environ.get('PICK_LIST_TIMEOUT', 120))
+graceful_timeout = timeout
+
+
+def when_ready(server):
+    # Runs in the master after the app is loaded and before any worker is forked
+    from pick_list import warm_up
+    mappings = warm_up()
+    server.log.info(f"Mappings {mappings.key} loaded, forking {server.num_workers} workers")
+
+
+def current_rss_mb():
+    # Resident memory of this process; falls back to the peak where /proc is missing
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if os.uname().sysname == 'Darwin' else peak / 1024
+
+
+def post_request(worker, req, environ, resp):
+    # Finish the current request, then let the master replace a worker that grew too large
+    rss_mb = current_rss_mb()
+    if rss_mb > MAX_RSS_MB:
+        worker.log.info(f"Worker {worker.pid} at {rss_mb:.0f} MB (limit {MAX_RSS_MB} MB), recycling")
+        worker.alive = False
+
+
+def child_exit(server, worker):
+    # Runs in the master for each worker that exits; its metrics stay in the /metrics totals
+    from metrics import retire_process
+    retire_process(worker.pid)
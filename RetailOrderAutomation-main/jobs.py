@@ -0,0 +1,201 @@
+import json
+import os
+import re
+import socket
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from order_report import ReportFormatError
+
+# How many pick lists a process builds at the same time; further uploads wait in its queue.
+# The limit is per process, not per server: gunicorn runs workers × MAX_JOBS at most.
+MAX_JOBS = int(os.environ.get('PICK_LIST_MAX_JOBS', 2))
+
+# How often (in seconds) a process touches the heartbeat file of each job it owns, and after
+# how long without a heartbeat a queued or running job is taken to have lost its process
+JOB_HEARTBEAT_INTERVAL = float(os.environ.get('PICK_LIST_JOB_HEARTBEAT_INTERVAL', 10))
+JOB_STALE_AFTER = float(os.environ.get('PICK_LIST_JOB_STALE_AFTER', 60))
+
+# Job states, in order
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+# Job IDs are uuid4 hex strings; anything else never reaches the filesystem
+JOB_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+# Error of a job whose process exited (recycled, killed or crashed) before it finished
+LOST_JOB_ERROR = "The worker building this pick list restarted before it finished, please upload the report again"
+
+
+def process_alive(pid):
+    # True unless this host has no process with that pid. On Windows os.kill would end
+    # the process, so there only the heartbeat counts.
+    if os.name == 'nt':
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # Someone else's process, but it exists
+    return True
+
+
+class JobQueue:
+    # Runs pick list builds on a bounded pool of worker threads, so an upload returns
+    # right away with a job ID. Each job has its own directory holding the upload, the
+    # output workbook and a job.json status file, which lets any process serving the
+    # same folder report the status and hand out the result. on_finish(job) is called
+    # for every job that ends, done or failed.
+    # A job lives only in the threads of the process that queued it (its pid and host are
+    # in the record) and that process touches the job's heartbeat file while it is queued
+    # or running. A job whose process is gone, or whose heartbeat stopped, is marked failed
+    # when it is next read, so nothing waits on it forever.
+
+    def __init__(self, folder, max_workers=MAX_JOBS, on_finish=None,
+                 heartbeat_interval=JOB_HEARTBEAT_INTERVAL, stale_after=JOB_STALE_AFTER):
+        self.folder = folder
+        self.max_workers = max_workers
+        self.on_finish = on_finish or (lambda job: None)
+        self.heartbeat_interval = heartbeat_interval
+        self.stale_after = stale_after
+        self._executor = None
+        self._heartbeat = None
+        self._active = set()
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        # Started on first use, so importing the app (or forking it) starts no threads
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                    thread_name_prefix='pick-list-job')
+                self._heartbeat = threading.Thread(target=self._beat, name='pick-list-job-heartbeat', daemon=True)
+                self._heartbeat.start()
+            return self._executor
+
+    def _beat(self):
+        while True:
+            with self._lock:
+                job_ids = list(self._active)
+            for job_id in job_ids:
+                self._touch(job_id)
+            time.sleep(self.heartbeat_interval)
+
+    def _touch(self, job_id):
+        try:
+            with open(os.path.join(self.job_dir(job_id), 'heartbeat'), 'a'):
+                pass
+            os.utime(os.path.join(self.job_dir(job_id), 'heartbeat'))
+        except FileNotFoundError:
+            pass  # Job directory swept away
+
+    def job_dir(self, job_id):
+        return os.path.join(self.folder, job_id)
+
+    def create(self, **fields):
+        # Register a new job and make its directory; fields are stored with the status
+        job = {
+            'id': uuid.uuid4().hex,
+            'status': QUEUED,
+            'created': time.time(),
+            'started': None,
+            'finished': None,
+            'error': None,
+            'result': None,
+            'pid': os.getpid(),
+            'host': socket.gethostname(),
+        }
+        job.update(fields)
+        os.makedirs(self.job_dir(job['id']))
+        self._save(job)
+        return job
+
+    def submit(self, job, fn, *args, **kwargs):
+        # Queue fn(*args, **kwargs); its return value becomes the job's result.
+        # The worker updates its own copy of the record.
+        pool = self._pool()
+        with self._lock:
+            self._active.add(job['id'])
+        self._touch(job['id'])
+        pool.submit(self._run, dict(job), fn, args, kwargs)
+        return job
+
+    def _run(self, job, fn, args, kwargs):
+        job.update(status=RUNNING, started=time.time())
+        self._save(job)
+        try:
+            job['result'] = fn(*args, **kwargs)
+            job['status'] = DONE
+        except ReportFormatError as e:
+            job.update(status=FAILED, error=str(e))
+        except Exception as e:
+            traceback.print_exc()
+            job.update(status=FAILED, error=f"Could not build the pick list: {e}")
+        job['finished'] = time.time()
+        self._save(job)
+        with self._lock:
+            self._active.discard(job['id'])
+        self.on_finish(job)
+
+    def get(self, job_id):
+        # The job's status record, or None for an unknown ID; a job that lost its process
+        # is marked failed first
+        if not JOB_ID_PATTERN.match(job_id):
+            return None
+        try:
+            with open(os.path.join(self.job_dir(job_id), 'job.json'), encoding='utf-8') as f:
+                job = json.load(f)
+        except FileNotFoundError:
+            return None
+        if self.is_lost(job):
+            job.update(status=FAILED, error=LOST_JOB_ERROR, finished=time.time())
+            self._save(job)
+            print(f"Job {job_id} of process {job.get('pid')} was lost, marked failed")
+            self.on_finish(job)
+        return job
+
+    def is_lost(self, job):
+        # A queued or running job whose process (on this host) has exited, or whose heartbeat
+        # has not moved for stale_after seconds (counted from its creation before the first one)
+        if job['status'] not in (QUEUED, RUNNING):
+            return False
+        with self._lock:
+            if job['id'] in self._active:
+                return False
+        if job.get('host') == socket.gethostname() and job.get('pid') and not process_alive(job['pid']):
+            return True
+        try:
+            heartbeat = os.path.getmtime(os.path.join(self.job_dir(job['id']), 'heartbeat'))
+        except FileNotFoundError:
+            heartbeat = job['created']
+        return time.time() - heartbeat > self.stale_after
+
+    def recover(self):
+        # Mark every lost job failed, e.g. at start-up after the previous workers exited
+        try:
+            job_ids = os.listdir(self.folder)
+        except FileNotFoundError:
+            return
+        for job_id in job_ids:
+            self.get(job_id)
+
+    def in_use(self, path):
+        # True for the directory of a job that is queued or running
+        if os.path.dirname(os.path.abspath(path)) != os.path.abspath(self.folder):
+            return False
+        job = self.get(os.path.basename(path))
+        return job is not None and job['status'] in (QUEUED, RUNNING)
+
+    def _save(self, job):
+        # Write to a temporary file and swap it in, so readers never see a partial record
+        path = os.path.join(self.job_dir(job['id']), 'job.json')
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(job, f)
+        os.replace(tmp_path, path)
@@ -0,0 +1,211 @@
+import atexit
+import contextlib
+import json
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: one process, nothing to lock against
+    fcntl = None
+
+# Each process serving the app keeps its own counts and writes them to <pid>.json here;
+# /metrics adds up the files of all processes. Kept outside the upload folder, whose
+# sweep would otherwise evict them.
+METRICS_FOLDER = os.environ.get('PICK_LIST_METRICS_FOLDER', 'metrics')
+
+# Counts of processes that have exited (gunicorn recycles workers), so totals never go down
+RETIRED_FILE = 'retired.json'
+RETIRED_LOCK_FILE = 'retired.lock'
+
+# How often (in seconds) at most a process writes its counts while serving requests; they are
+# also written when /metrics is scraped and when the process exits
+METRICS_FLUSH_INTERVAL = float(os.environ.get('PICK_LIST_METRICS_FLUSH_INTERVAL', 5))
+
+# Upper bounds (in seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+# Every metric exposed: name -> (type, help)
+METRICS = {
+    'pick_list_stage_seconds': ('histogram', "Time spent in each stage of building a pick list"),
+    'pick_list_request_seconds': ('histogram', "Time taken to answer HTTP requests, by endpoint"),
+    'pick_list_requests_total': ('counter', "HTTP requests answered, by endpoint and status code"),
+    'pick_list_jobs_total': ('counter', "Pick list jobs finished, by status"),
+    'pick_list_order_lines_total': ('counter', "Order lines in the reports pick lists were built from"),
+    'pick_list_pick_lines_total': ('counter', "Lines written to pick lists"),
+    'pick_list_bytes_in_total': ('counter', "Bytes of reports uploaded"),
+    'pick_list_bytes_out_total': ('counter', "Bytes of pick list workbooks built"),
+    'pick_list_cache_lookups_total': ('counter', "Result and frame cache lookups, by cache and result"),
+    'pick_list_skipped_lines_total': ('counter', "Order lines left out of new-only pick lists as already picked"),
+}
+
+
+def series_name(name, labels):
+    # A series as written in the Prometheus text format, e.g. pick_list_jobs_total{status="done"}
+    if not labels:
+        return name
+    escape = lambda value: str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+    return name + '{' + ','.join(f'{label}="{escape(value)}"' for label, value in sorted(labels.items())) + '}'
+
+
+def empty_counts():
+    return {'counters': {}, 'histograms': {}}
+
+
+def add_counts(total, counts):
+    # Add one process's counts to a running total
+    for series, value in counts['counters'].items():
+        total['counters'][series] = total['counters'].get(series, 0) + value
+    for series, histogram in counts['histograms'].items():
+        into = total['histograms'].setdefault(series, {'buckets': [0] * len(histogram['buckets']), 'sum': 0, 'count': 0})
+        into['buckets'] = [a + b for a, b in zip(into['buckets'], histogram['buckets'])]
+        into['sum'] += histogram['sum']
+        into['count'] += histogram['count']
+    return total
+
+
+def read_counts(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None  # Gone, or (after a crash) unreadable
+
+
+def write_counts(path, counts):
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(counts, f)
+    os.replace(tmp_path, path)
+
+
+@contextlib.contextmanager
+def retired_lock(folder):
+    # Held while the retired totals are read, added to and written back
+    if fcntl is None:
+        yield
+        return
+    with open(os.path.join(folder, RETIRED_LOCK_FILE), 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def retire_process(pid, folder=METRICS_FOLDER):
+    # Fold the counts of an exited process into the retired totals. Called by the gunicorn
+    # master for each worker that exits, and by a process for a file an earlier process
+    # left under its pid, so the update is done under a file lock.
+    path = os.path.join(folder, f'{pid}.json')
+    with retired_lock(folder):
+        counts = read_counts(path)
+        if counts is None:
+            return
+        retired_path = os.path.join(folder, RETIRED_FILE)
+        write_counts(retired_path, add_counts(read_counts(retired_path) or empty_counts(), counts))
+        os.remove(path)
+
+
+class MetricsRegistry:
+    # Counters and latency histograms of this process. Updating them only touches a dict;
+    # flush() writes them out for the other processes (maybe_flush() at most once per
+    # flush_interval), and render() adds up every process's counts in the Prometheus text format.
+
+    def __init__(self, folder=METRICS_FOLDER, flush_interval=METRICS_FLUSH_INTERVAL):
+        # Absolute, so the exit flush finds it whatever the working directory is by then
+        self.folder = os.path.abspath(folder)
+        self.flush_interval = flush_interval
+        os.makedirs(folder, exist_ok=True)
+        self._reset()
+        # A forked worker starts from zero rather than with a copy of the master's counts
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset)
+        # Counts since the last write are not lost when the process exits
+        atexit.register(self.flush)
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._counts = empty_counts()
+        self._pid = None
+        self._changed = False
+        self._flushed_at = time.monotonic()
+
+    def inc(self, name, value=1, **labels):
+        series = series_name(name, labels)
+        with self._lock:
+            self._counts['counters'][series] = self._counts['counters'].get(series, 0) + value
+            self._changed = True
+
+    def observe(self, name, seconds, **labels):
+        series = series_name(name, labels)
+        with self._lock:
+            histogram = self._counts['histograms'].get(series)
+            if histogram is None:
+                histogram = self._counts['histograms'][series] = {
+                    'buckets': [0] * (len(LATENCY_BUCKETS) + 1), 'sum': 0, 'count': 0}
+            bucket = next((i for i, bound in enumerate(LATENCY_BUCKETS) if seconds <= bound), len(LATENCY_BUCKETS))
+            histogram['buckets'][bucket] += 1
+            histogram['sum'] += seconds
+            histogram['count'] += 1
+            self._changed = True
+
+    def observe_stage(self, stage, seconds):
+        # Stage observer (see stage_timing.add_stage_observer)
+        self.observe('pick_list_stage_seconds', seconds, stage=stage)
+
+    def flush(self):
+        # Write this process's counts to its file, if they changed since the last write
+        pid = os.getpid()
+        with self._lock:
+            self._flushed_at = time.monotonic()
+            if not self._changed:
+                return
+            if self._pid != pid:
+                # First write: a file left under this pid by an earlier process is kept in the totals
+                retire_process(pid, self.folder)
+                self._pid = pid
+            write_counts(os.path.join(self.folder, f'{pid}.json'), self._counts)
+            self._changed = False
+
+    def maybe_flush(self):
+        # flush(), unless this process wrote its counts less than flush_interval ago
+        if time.monotonic() - self._flushed_at >= self.flush_interval:
+            self.flush()
+
+    def collect(self):
+        # Counts of all processes, this one's included
+        self.flush()
+        total = empty_counts()
+        for entry in os.scandir(self.folder):
+            if entry.name.endswith('.json'):
+                counts = read_counts(entry.path)
+                if counts is not None:
+                    add_counts(total, counts)
+        return total
+
+    def render(self):
+        counts = self.collect()
+        lines = []
+        for name, (metric_type, help_text) in METRICS.items():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {metric_type}')
+            if metric_type == 'counter':
+                for series, value in sorted(counts['counters'].items()):
+                    if series.split('{')[0] == name:
+                        lines.append(f'{series} {value}')
+                continue
+            for series, histogram in sorted(counts['histograms'].items()):
+                if series.split('{')[0] != name:
+                    continue
+                labels = series[len(name):].strip('{}')
+                prefix = labels + ',' if labels else ''
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), histogram['buckets']):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+                suffix = '{' + labels + '}' if labels else ''
+                lines.append(f'{name}_sum{suffix} {histogram["sum"]}')
+                lines.append(f'{name}_count{suffix} {histogram["count"]}')
+        return '\n'.join(lines) + '\n'
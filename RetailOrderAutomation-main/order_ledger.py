@@ -0,0 +1,160 @@
+import os
+import sqlite3
+import threading
+import time
+
+from order_report import ORDER_LINE_KEYS
+
+# Order lines already put on a pick list (by order-id and sku), so "only new" uploads can
+# leave them out. Kept outside the upload folder, whose sweep would otherwise evict it.
+LEDGER_PATH = os.environ.get('PICK_LIST_LEDGER', 'ledger.sqlite3')
+
+# Lines missing from every report for this many days are dropped from the ledger
+LEDGER_RETENTION_DAYS = float(os.environ.get('PICK_LIST_LEDGER_RETENTION_DAYS', 30))
+
+# How often (in seconds) a process compacts the ledger after recording a run
+LEDGER_COMPACT_INTERVAL = float(os.environ.get('PICK_LIST_LEDGER_COMPACT_INTERVAL', 3600))
+
+# The primary key is the (order_id, sku) index every lookup goes through; 'seen' is
+# indexed for compaction. auto_vacuum only takes effect on a new file.
+SCHEMA = """
+PRAGMA auto_vacuum = INCREMENTAL;
+CREATE TABLE IF NOT EXISTS order_lines (
+    order_id TEXT NOT NULL,
+    sku TEXT NOT NULL,
+    emitted REAL NOT NULL,  -- first put on a pick list
+    seen REAL NOT NULL,     -- last in an uploaded report
+    PRIMARY KEY (order_id, sku)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS order_lines_seen ON order_lines (seen);
+"""
+
+
+def line_keys(df):
+    # (order-id, sku) of each order line as text, missing values as ''
+    return [df[column].astype(object).where(df[column].notna(), '').astype(str) for column in ORDER_LINE_KEYS]
+
+
+class LedgerRun:
+    # The order lines of one pick list being built. Lines are checked against the ledger
+    # as it was when the run started and only written to it when the run ends without
+    # an error, so a failed build leaves the ledger as it was.
+
+    def __init__(self, ledger):
+        self.ledger = ledger
+        self.new_lines = 0
+        self.known_lines = 0
+        # Autocommit, so a run never holds a lock on the ledger; its lines wait in
+        # temporary tables (on disk, like the ledger) until it is recorded
+        self._db = ledger.connect()
+        self._db.execute('CREATE TEMP TABLE run_lines (order_id TEXT NOT NULL, sku TEXT NOT NULL)')
+        self._db.execute('CREATE TEMP TABLE chunk_lines (order_id TEXT NOT NULL, sku TEXT NOT NULL)')
+
+    def add(self, df, new_only=False):
+        # Add a frame of order lines (a whole report or one chunk of it) to the run and return
+        # the lines that go on the pick list: all of them, or with new_only those not on an
+        # earlier one, found with one anti-join of the frame against the ledger
+        import pandas as pd
+        order_ids, skus = line_keys(df)
+        db = self._db
+        db.execute('DELETE FROM chunk_lines')
+        db.executemany('INSERT INTO chunk_lines VALUES (?, ?)', zip(order_ids, skus))
+        db.execute('INSERT INTO run_lines SELECT order_id, sku FROM chunk_lines')
+        if not new_only:
+            self.new_lines += len(df)
+            return df
+
+        known = db.execute(
+            'SELECT DISTINCT c.order_id, c.sku FROM chunk_lines c '
+            'JOIN main.order_lines l ON l.order_id = c.order_id AND l.sku = c.sku').fetchall()
+        if not known:
+            self.new_lines += len(df)
+            return df
+        is_known = pd.MultiIndex.from_arrays([order_ids, skus]).isin(pd.MultiIndex.from_tuples(known))
+        self.known_lines += int(is_known.sum())
+        self.new_lines += int((~is_known).sum())
+        return df[~is_known].reset_index(drop=True)
+
+    def record(self):
+        # Write the run's lines to the ledger: new ones as emitted now, all of them as seen now
+        now = time.time()
+        self._db.execute(
+            'INSERT INTO main.order_lines (order_id, sku, emitted, seen) '
+            'SELECT order_id, sku, ?, ? FROM run_lines WHERE true '
+            'ON CONFLICT (order_id, sku) DO UPDATE SET seen = excluded.seen', (now, now))
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                self.record()
+        finally:
+            self.close()
+        if exc_type is None:
+            self.ledger.maybe_compact()
+
+
+class OrderLedger:
+    # SQLite file of the order lines put on pick lists, shared by every process serving
+    # the app. Lines not seen in any report for retention_days are compacted away, so
+    # the ledger only holds the orders that can still show up in a report.
+
+    def __init__(self, path=LEDGER_PATH, retention_days=LEDGER_RETENTION_DAYS,
+                 compact_interval=LEDGER_COMPACT_INTERVAL):
+        self.path = path
+        self.retention_days = retention_days
+        self.compact_interval = compact_interval
+        self._last_compact = time.time()
+        self._lock = threading.Lock()
+        db = self.connect()
+        try:
+            # WAL lets uploads read the ledger while another one records its lines
+            db.execute('PRAGMA journal_mode = WAL')
+            db.executescript(SCHEMA)
+        finally:
+            db.close()
+
+    def connect(self):
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def run(self):
+        # with ledger.run() as run: lines = run.add(df, new_only) ... build the pick list
+        return LedgerRun(self)
+
+    def compact(self):
+        # Drop lines not seen within the retention window and give their pages back
+        cutoff = time.time() - self.retention_days * 24 * 3600
+        db = self.connect()
+        try:
+            removed = db.execute('DELETE FROM order_lines WHERE seen < ?', (cutoff,)).rowcount
+            db.execute('PRAGMA incremental_vacuum')
+            db.execute('PRAGMA optimize')
+        finally:
+            db.close()
+        return removed
+
+    def maybe_compact(self):
+        with self._lock:
+            if time.time() - self._last_compact < self.compact_interval:
+                return
+            self._last_compact = time.time()
+        self.compact()
+
+    def stats(self):
+        db = self.connect()
+        try:
+            lines, oldest, newest = db.execute('SELECT COUNT(*), MIN(emitted), MAX(emitted) FROM order_lines').fetchone()
+        finally:
+            db.close()
+        return {
+            'lines': lines,
+            'oldest_emitted': oldest,
+            'newest_emitted': newest,
+            'bytes': os.path.getsize(self.path),
+            'retention_days': self.retention_days,
+        }
@@ -0,0 +1,262 @@
+import codecs
+import contextlib
+import csv
+import io
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from stage_timing import stage
+
+# pandas and openpyxl are imported by the readers that use them, so importing this
+# module (e.g. for ReportFormatError) stays cheap
+
+# The only columns of the Amazon order report the pick list uses, in layout order
+ORDER_LINE_COLUMNS = ['order-id', 'recipient-name', 'sku', 'quantity-purchased']
+
+# The columns the Fx5 export needs; reports without the other order line columns are
+# accepted for it, with those columns left blank
+FX5_COLUMNS = ['sku', 'quantity-purchased']
+
+# How many worker processes parse reports when several are read at once
+PARSE_WORKERS = int(os.environ.get('PICK_LIST_PARSE_WORKERS', os.cpu_count() or 1))
+
+# Block size (bytes) the encoding of a flat file is checked in
+SNIFF_BLOCK_BYTES = 1024 * 1024
+
+# Columns that identify one order line across reports
+ORDER_LINE_KEYS = ['order-id', 'sku']
+
+# Explicit, compact dtypes for the order line frame
+ORDER_LINE_DTYPES = {
+    'order-id': object,
+    'recipient-name': object,
+    'sku': 'category',
+    'quantity-purchased': 'int32',
+}
+
+
+class ReportFormatError(ValueError):
+    # Raised when an uploaded file is not an Amazon order report
+    pass
+
+
+def check_header(header, required=ORDER_LINE_COLUMNS):
+    # Every required column must be in the header row; returns the position of each order
+    # line column, None for an optional one the report does not have
+    missing = [column for column in required if column not in header]
+    if missing:
+        raise ReportFormatError(f"Not an Amazon order report, missing columns: {', '.join(missing)}")
+    return [header.index(column) if column in header else None for column in ORDER_LINE_COLUMNS]
+
+
+def build_order_lines(columns, line_count=None):
+    # columns maps each order line column the report has to its list of values; the
+    # others are left blank
+    import pandas as pd
+    if line_count is None:
+        line_count = len(next(iter(columns.values())))
+    df = pd.DataFrame({column: pd.Series(columns.get(column, [None] * line_count), dtype=object)
+                       for column in ORDER_LINE_COLUMNS})
+    df['quantity-purchased'] = pd.to_numeric(df['quantity-purchased'], errors='coerce').fillna(0)
+    return df.astype(ORDER_LINE_DTYPES)
+
+
+def rewind(source):
+    # Reports are read from a path or from a binary file object such as an upload stream;
+    # a file object is read more than once, so it starts over at every read
+    if hasattr(source, 'read'):
+        source.seek(0)
+    return source
+
+
+def open_report(source):
+    # Open a path, or use a file object as it is (and leave it open)
+    if hasattr(source, 'read'):
+        return contextlib.nullcontext(rewind(source))
+    return open(source, 'rb')
+
+
+def iter_excel_order_lines(source, chunk_lines=None, required=ORDER_LINE_COLUMNS):
+    # Open in read-only mode: the header row is checked before any data row is parsed,
+    # then only the four order line columns are pulled out of each streamed row.
+    # Yields frames of up to chunk_lines order lines (one frame with all of them for None).
+    from openpyxl import load_workbook
+    wb = load_workbook(rewind(source), read_only=True, data_only=True)
+    try:
+        ws = wb.worksheets[0]
+        header = next(ws.iter_rows(max_row=1, values_only=True), ())
+        header = [str(name).strip() if name is not None else '' for name in header]
+        positions = check_header(header, required)
+
+        # Only parse the span of columns that holds the ones the report has
+        present = [position for position in positions if position is not None]
+        first, last = min(present), max(present)
+        offsets = [position - first if position is not None else None for position in positions]
+
+        columns = {column: [] for column in ORDER_LINE_COLUMNS}
+        line_count = 0
+        for row in ws.iter_rows(min_row=2, min_col=first + 1, max_col=last + 1, values_only=True):
+            values = [row[offset] if offset is not None and offset < len(row) else None for offset in offsets]
+            if all(value is None for value in values):
+                continue  # Skip blank rows
+            for column, value in zip(ORDER_LINE_COLUMNS, values):
+                columns[column].append(value)
+            line_count += 1
+            if line_count == chunk_lines:
+                yield build_order_lines(columns)
+                columns = {column: [] for column in ORDER_LINE_COLUMNS}
+                line_count = 0
+        if line_count or chunk_lines is None:
+            yield build_order_lines(columns)
+    finally:
+        wb.close()
+
+
+def read_excel_order_lines(source, required=ORDER_LINE_COLUMNS):
+    return next(iter_excel_order_lines(source, required=required))
+
+
+def detect_format(source):
+    # Decide by content, not by extension: XLSX is a zip archive, legacy XLS an OLE2 file,
+    # anything else is treated as Amazon's delimited flat file
+    with open_report(source) as f:
+        head = f.read(4096)
+    if head.startswith(b'PK\x03\x04'):
+        return 'xlsx'
+    if head.startswith(b'\xd0\xcf\x11\xe0'):
+        return 'xls'
+    if b'\x00' in head:
+        raise ReportFormatError("Not an Amazon order report, unrecognized binary file")
+    return 'text'
+
+
+def sniff_text(source):
+    # Work out the encoding and the delimiter. The header is plain ASCII either way, so the
+    # whole file is checked (a block at a time) for UTF-8; anything else is read as cp1252,
+    # as Seller Central exports it for non-English recipient names.
+    with open_report(source) as f:
+        first_line = f.readline()
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        try:
+            decoder.decode(first_line)
+            for block in iter(lambda: f.read(SNIFF_BLOCK_BYTES), b''):
+                decoder.decode(block)
+            decoder.decode(b'', final=True)
+            encoding = 'utf-8-sig'
+        except UnicodeDecodeError:
+            encoding = 'cp1252'
+    header_line = first_line.decode(encoding, errors='replace')
+    delimiter = '\t' if '\t' in header_line else ','
+    return encoding, delimiter, header_line
+
+
+def iter_text_order_lines(source, chunk_lines=None, required=ORDER_LINE_COLUMNS):
+    # Amazon's native flat file is tab-delimited with no quoting; CSV exports are also accepted.
+    # Yields frames of up to chunk_lines order lines (one frame with all of them for None).
+    import pandas as pd
+    encoding, delimiter, header_line = sniff_text(source)
+    header = [name.strip() for name in next(csv.reader([header_line], delimiter=delimiter), [])]
+    positions = check_header(header, required)
+    present = [column for column, position in zip(ORDER_LINE_COLUMNS, positions) if position is not None]
+
+    options = dict(
+        sep=delimiter,
+        encoding=encoding,
+        # The few bytes cp1252 leaves undefined become U+FFFD instead of failing the report
+        encoding_errors='replace',
+        usecols=present,
+        dtype=str,
+        quoting=csv.QUOTE_NONE if delimiter == '\t' else csv.QUOTE_MINIMAL,
+        keep_default_na=False,
+        na_values=[''],
+        skip_blank_lines=True,
+    )
+    if chunk_lines is None:
+        chunks = [pd.read_csv(rewind(source), **options)]
+    else:
+        chunks = pd.read_csv(rewind(source), chunksize=chunk_lines, **options)
+    for df in chunks:
+        yield build_order_lines({column: df[column].str.strip() for column in present}, len(df))
+
+
+def read_text_order_lines(source, required=ORDER_LINE_COLUMNS):
+    return next(iter_text_order_lines(source, required=required))
+
+
+def read_xls_order_lines(source, required=ORDER_LINE_COLUMNS):
+    # Legacy .xls files go through pandas (needs xlrd), still reading only the needed columns
+    import pandas as pd
+    header = [str(name).strip() for name in pd.read_excel(rewind(source), nrows=0).columns]
+    positions = check_header(header, required)
+    present = [column for column, position in zip(ORDER_LINE_COLUMNS, positions) if position is not None]
+    df = pd.read_excel(rewind(source), usecols=present, dtype=object)
+    return build_order_lines({column: df[column] for column in present}, len(df))
+
+
+def read_order_lines(source, required=ORDER_LINE_COLUMNS):
+    # Read the order lines of a report (a path, or an upload stream parsed without saving it),
+    # rejecting files without the required columns (all four unless fewer are asked for)
+    with stage('read'):
+        report_format = detect_format(source)
+        if report_format == 'xlsx':
+            return read_excel_order_lines(source, required)
+        if report_format == 'xls':
+            return read_xls_order_lines(source, required)
+        return read_text_order_lines(source, required)
+
+
+def read_order_line_chunks(source, chunk_lines):
+    # Read a report as frames of up to chunk_lines order lines each, so a report of any size
+    # can be processed in bounded memory. Legacy .xls files (at most 65536 rows) are read
+    # whole and then split.
+    report_format = detect_format(source)
+    if report_format == 'xlsx':
+        chunks = iter_excel_order_lines(source, chunk_lines)
+    elif report_format == 'xls':
+        df = read_xls_order_lines(source)
+        chunks = (df.iloc[start:start + chunk_lines] for start in range(0, max(len(df), 1), chunk_lines))
+    else:
+        chunks = iter_text_order_lines(source, chunk_lines)
+    while True:
+        # Only the reading is timed, not the work done on each chunk in between
+        with stage('read'):
+            df = next(chunks, None)
+        if df is None:
+            return
+        yield df
+
+
+def read_named_order_lines(name, source):
+    # Read one report of a batch (source may also be its bytes); errors name the report
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    try:
+        return read_order_lines(source)
+    except ReportFormatError as e:
+        raise ReportFormatError(f"{name}: {e}") from None
+
+
+def read_many_order_lines(named_sources, max_workers=PARSE_WORKERS):
+    # Parse several (name, source) reports at once, one per worker process, keeping their order.
+    # A single report is read in-process. Workers are spawned, not forked, because the
+    # calling process may be running other threads, and the batch is timed here as one
+    # 'read' stage because the workers' own stages are not seen by this process.
+    if len(named_sources) == 1 or max_workers <= 1:
+        return [read_named_order_lines(name, source) for name, source in named_sources]
+    names, sources = zip(*named_sources)
+    context = multiprocessing.get_context('spawn')
+    with stage('read'), ProcessPoolExecutor(max_workers=min(max_workers, len(named_sources)),
+                                            mp_context=context) as pool:
+        return list(pool.map(read_named_order_lines, names, sources))
+
+
+def merge_order_lines(frames):
+    # One frame for several reports. An order line already seen in an earlier report
+    # (same order-id and sku) is dropped; lines repeated within one report are kept.
+    import pandas as pd
+    with stage('merge'):
+        df = pd.concat(frames, keys=range(len(frames)), names=['report', None]).reset_index(level='report')
+        first_report = df.groupby(ORDER_LINE_KEYS, dropna=False, observed=True)['report'].transform('min')
+        df = df.loc[df['report'] == first_report, ORDER_LINE_COLUMNS].reset_index(drop=True)
+        return df.astype(ORDER_LINE_DTYPES)
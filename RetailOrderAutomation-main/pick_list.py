@@ -0,0 +1,200 @@
+import pandas as pd
+
+from pick_list_writer import new_workbook, write_layout_sheet, separated_rows
+from style_mapping import map_styles, get_mappings
+from sku_parser import parse_skus
+from stage_timing import stage
+
+# Columns that identify one line on the pick list
+PICK_LINE_KEYS = ['Style', 'Color', 'Size']
+
+# Columns whose change starts a new block (after a blank row) in the second layout
+GROUP_BY_OPTIONS = {
+    'style': ['Style'],
+    'color': ['Style', 'Color'],
+    'size': ['Style', 'Color', 'Size'],
+}
+
+# Column widths of Layout 1
+LAYOUT_1_WIDTHS = {
+    1: 30,  # Width for 'order-id'
+    2: 30,  # Width for 'recipient-name'
+    3: 30,  # Width for 'sku'
+    4: 10   # Width for 'QTY'
+}
+
+
+def consolidate_lines(df, keys=PICK_LINE_KEYS):
+    # One row per Style/Color/Size (in sorted order) with the summed Qty and the
+    # number of order lines behind it; an already consolidated frame sums its Orders
+    grouped = df.groupby(keys, sort=True, dropna=False, observed=True)
+    if 'Orders' in df.columns:
+        consolidated = grouped[['Qty', 'Orders']].sum()
+    else:
+        consolidated = grouped['Qty'].agg(Qty='sum', Orders='size')
+    return consolidated.reset_index()
+
+
+def size_dtype(sizes, size_order):
+    # Sizes in shelf order, then any sizes missing from size_order alphabetically at the end
+    known = list(dict.fromkeys(size_order))
+    unknown = sorted(set(sizes.dropna().unique()) - set(known))
+    return pd.CategoricalDtype(known + unknown, ordered=True)
+
+
+def as_categoricals(df, size_order):
+    # Style and Color as categoricals (categories in alphabetical order) and Size in shelf order,
+    # so sorting and grouping run on integer codes
+    df['Style'] = df['Style'].astype('category')
+    df['Color'] = df['Color'].astype('category')
+    df['Size'] = df['Size'].astype(size_dtype(df['Size'], size_order))
+    return df
+
+
+def warm_up():
+    # Optional hook for servers: pull in pandas/openpyxl and compile the mappings before the
+    # first upload (gunicorn.conf.py calls it in the master, before forking workers)
+    new_workbook()
+    return get_mappings()
+
+
+def layout_2_widths(consolidated):
+    # Set the width of columns in Layout 2
+    column_widths_layout_2 = {
+        1: 20,  # Width for 'Style'
+        2: 20,  # Width for 'Color'
+        3: 15,  # Width for 'Size'
+        4: 10,   # Width for 'QTY',
+        5: 45   # Width for 'Packs from #1 or No Inv.'            
+    }
+    if consolidated:
+        column_widths_layout_2[5] = 10  # Width for 'Orders'
+        column_widths_layout_2[6] = 45  # Width for 'Packs from #1 or No Inv.'
+    return column_widths_layout_2
+
+
+def layout_3_widths(consolidated):
+    # Set the width of columns in Layout 3
+    column_widths_layout_3 = {
+        1: 20,  # Width for 'Style'
+        2: 15,  # Width for 'Color'
+        3: 15,  # Width for 'Size'
+        4: 10   # Width for 'Qty'
+    }
+    if consolidated:
+        column_widths_layout_3[5] = 10  # Width for 'Orders'
+    return column_widths_layout_3
+
+
+def pick_lines(df):
+    # The order lines as unsorted pick lines: Style, Color and Size from the SKU, Qty and
+    # the blank "Packs from #1 or No Inv." column
+    df_second_layout = df.copy()
+
+    # Delete specified columns for the second layout
+    df_second_layout.drop(columns=['order-id', 'recipient-name'], inplace=True)
+
+    # Split the 'sku' into Style, Color, Size and Other; each distinct SKU is parsed once and cached
+    with stage('parse_skus'):
+        sku_parts = parse_skus(df_second_layout['sku'])
+        df_second_layout[['Style', 'Color', 'Size', 'Other']] = sku_parts[['Style', 'Color', 'Size', 'Other']]
+
+    # Malformed SKUs (fewer than three parts) are flagged instead of failing the upload
+    malformed = df_second_layout.loc[sku_parts['Malformed'], 'sku']
+    if len(malformed):
+        print(f"Malformed SKUs: {malformed.astype(str).unique().tolist()}")
+
+    # Retain the required columns and remove the original 'sku' column
+    df_second_layout = df_second_layout[['Style', 'Color', 'Size', 'quantity-purchased', 'Other']]
+
+    # Rename 'quantity-purchased' to 'Qty'
+    df_second_layout.rename(columns={'quantity-purchased': 'Qty'}, inplace=True)
+
+    # Set the 'Other' column values to blank (for rows where it previously had 'BD')
+    df_second_layout['Other'] = ''
+
+    # Rename the last column to "Packs from #1 or No Inv."
+    df_second_layout.rename(columns={'Other': 'Packs from #1 or No Inv.'}, inplace=True)
+    return df_second_layout
+
+
+def write_pick_layouts(wb, today, df_second_layout, group_by, consolidated):
+    # Write Layout 2 and Layout 3 for pick lines already sorted by Style, Color and Size
+    # and return the row counts of both sheets
+
+    # Consolidated mode: one line per Style/Color/Size with the summed Qty and its order count
+    if consolidated:
+        with stage('consolidate'):
+            df_second_layout = consolidate_lines(df_second_layout.drop(columns=['Packs from #1 or No Inv.']))
+            df_second_layout['Packs from #1 or No Inv.'] = ''
+
+    # Rows for the second sheet, with a blank row between groups (found from vectorized group boundaries)
+    group_columns = GROUP_BY_OPTIONS.get(group_by, GROUP_BY_OPTIONS['style'])
+    new_rows = separated_rows(df_second_layout, group_columns)
+
+    # Process the DataFrame for the third layout
+    df_third_layout = df_second_layout.copy()  # Start from the second layout DataFrame
+
+    # Remove the 5th column ('Packs from #1 or No Inv.') to create the third layout
+    df_third_layout.drop(columns=['Packs from #1 or No Inv.'], inplace=True)
+
+    # Update the 'Style' column from the compiled style and plus-size mappings
+    with stage('map_styles'):
+        df_third_layout['Style'] = map_styles(df_third_layout['Style'], df_third_layout['Size'])
+
+    # Styles that map to the same Fx5 style are merged into one line
+    if consolidated:
+        with stage('consolidate'):
+            df_third_layout = consolidate_lines(df_third_layout)
+
+    # Layout 2: style-grouped pick list with blank separator rows
+    with stage('write_layout_2'):
+        write_layout_sheet(wb, f'{today}-', df_second_layout.columns, new_rows,
+                           layout_2_widths(consolidated), total_qty=df_second_layout['Qty'].sum())
+
+    # Layout 3: Fx5 reformatted styles
+    with stage('write_layout_3'):
+        write_layout_sheet(wb, 'Fx5Reformatted', df_third_layout.columns, df_third_layout.itertuples(index=False, name=None),
+                           layout_3_widths(consolidated))
+
+    return len(df_second_layout), len(df_third_layout)
+
+
+def build_pick_list(df, output, today, group_by='style', consolidated=False):
+    # Write the three layouts for a frame of order lines to output (a path or a file object)
+    # and return the row counts of each sheet
+
+    # The first layout is the order lines as read, with 'quantity-purchased' shown as 'Qty'
+    df_first_layout = df.rename(columns={'quantity-purchased': 'Qty'})
+
+    # Process the DataFrame for the second layout
+    df_second_layout = pick_lines(df)
+
+    with stage('sort'):
+        # Sizes sort in shelf order (XS, S, M, L, XL, 1X-4X, ...) rather than as plain strings
+        df_second_layout = as_categoricals(df_second_layout, get_mappings().size_order)
+
+        # Sort the DataFrame first by 'Style', then by 'Color', and then by 'Size' within the same 'Style' and 'Color'
+        df_second_layout = df_second_layout.sort_values(by=['Style', 'Color', 'Size'], ascending=[True, True, True]).reset_index(drop=True)
+
+    # Build all three sheets in one pass on a write-only workbook, so the file
+    # is serialized exactly once and rows are styled as they are streamed out
+    wb = new_workbook()
+
+    # Layout 1: order lines with the "Total" row under columns C and D
+    with stage('write_layout_1'):
+        write_layout_sheet(wb, today, df_first_layout.columns, df_first_layout.itertuples(index=False, name=None),
+                           LAYOUT_1_WIDTHS, total_qty=df_first_layout['Qty'].sum())
+
+    # Layouts 2 and 3: the sorted pick list and the Fx5 reformatted styles
+    pick_line_count, fx5_line_count = write_pick_layouts(wb, today, df_second_layout, group_by, consolidated)
+
+    # Save the workbook after all modifications
+    with stage('save'):
+        wb.save(output)
+
+    return {
+        'order_lines': len(df_first_layout),
+        'pick_lines': pick_line_count,
+        'fx5_lines': fx5_line_count,
+    }
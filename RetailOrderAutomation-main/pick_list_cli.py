@@ -0,0 +1,124 @@
+import argparse
+import glob
+import importlib
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+from order_report import read_order_lines, ReportFormatError, FX5_COLUMNS
+from pick_list_stream import STREAM_MEMORY_MB
+
+# Files picked up when a directory is given
+REPORT_EXTENSIONS = ('.xls', '.xlsx', '.txt', '.tsv', '.csv')
+
+# Module and function each output format is built with, and the suffix of its file name;
+# imported by the workers, so --help and argument errors do not load pandas
+FORMATS = {
+    'pick-list': ('pick_list', 'build_pick_list', 'Pick List'),
+    'fx5': ('fx5_export', 'build_fx5_export', 'Fx5'),
+}
+
+# Same choices as pick_list.GROUP_BY_OPTIONS
+GROUP_BY_CHOICES = ['style', 'color', 'size']
+
+
+def find_reports(patterns):
+    # Expand files, directories (every report in them) and glob patterns, in order, once each
+    paths = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern, recursive=True)) if glob.has_magic(pattern) else [pattern]
+        for match in matches:
+            if os.path.isdir(match):
+                paths.extend(sorted(os.path.join(match, name) for name in os.listdir(match)
+                                    if name.lower().endswith(REPORT_EXTENSIONS)))
+            else:
+                paths.append(match)
+    return list(dict.fromkeys(paths))
+
+
+def process_report(filepath, output_dir, output_format, today, group_by, consolidated, stream_memory_mb=None):
+    # Read one report and write its workbook with the same code as the web app;
+    # runs in a worker process, so failures come back as part of the result.
+    # With stream_memory_mb the pick list is built from chunks within that memory budget.
+    module_name, function_name, suffix = FORMATS[output_format]
+    build = getattr(importlib.import_module(module_name), function_name)
+    # Keep the extension in the name, so report.txt and report.csv do not overwrite each other
+    output_filepath = os.path.join(output_dir, f'{os.path.basename(filepath)} - {suffix}.xlsx')
+    result = {'report': filepath, 'output': output_filepath, 'error': None}
+
+    try:
+        started = time.perf_counter()
+        if stream_memory_mb is not None:
+            # Reading is interleaved with building, so it all counts as build time
+            from pick_list_stream import build_pick_list_stream
+            read_done = started
+            result.update(build_pick_list_stream(filepath, output_filepath, today, group_by, consolidated,
+                                                 stream_memory_mb))
+        else:
+            if output_format == 'pick-list':
+                df = read_order_lines(filepath)
+                read_done = time.perf_counter()
+                result.update(build(df, output_filepath, today, group_by, consolidated))
+            else:
+                # The Fx5 export only needs the sku and quantity columns
+                df = read_order_lines(filepath, required=FX5_COLUMNS)
+                read_done = time.perf_counter()
+                result.update(build(df, output_filepath))
+        result['read_seconds'] = read_done - started
+        result['build_seconds'] = time.perf_counter() - read_done
+    except (ReportFormatError, OSError) as e:
+        result['error'] = str(e)
+    except Exception as e:
+        # e.g. a corrupt workbook (BadZipFile); the rest of the batch goes on
+        result['error'] = f"{type(e).__name__}: {e}"
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build pick lists from Amazon order reports without the web app")
+    parser.add_argument('reports', nargs='+', help="report files, directories or glob patterns (quote them)")
+    parser.add_argument('-o', '--output-dir', required=True, help="directory for the generated workbooks")
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count() or 1, help="worker processes")
+    parser.add_argument('--format', choices=sorted(FORMATS), default='pick-list', help="workbook to build")
+    parser.add_argument('--group-by', choices=GROUP_BY_CHOICES, default='style',
+                        help="blank row between styles, colors or sizes")
+    parser.add_argument('--consolidated', action='store_true', help="one line per Style/Color/Size")
+    parser.add_argument('--date', default=datetime.now().strftime("%Y%m%d"),
+                        help="date used in the sheet names (default today, YYYYMMDD)")
+    parser.add_argument('--stream', action='store_true',
+                        help="read reports in chunks, for reports too large to load whole (pick-list format)")
+    parser.add_argument('--memory-mb', type=float, default=STREAM_MEMORY_MB,
+                        help="memory budget per report in --stream mode")
+    args = parser.parse_args(argv)
+    if args.stream and args.format != 'pick-list':
+        parser.error("--stream only builds the pick-list format")
+
+    reports = find_reports(args.reports)
+    if not reports:
+        parser.error("no reports found")
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    started = time.perf_counter()
+    failed = 0
+    with ProcessPoolExecutor(max_workers=max(1, min(args.workers, len(reports)))) as pool:
+        futures = [pool.submit(process_report, report, args.output_dir, args.format, args.date, args.group_by,
+                               args.consolidated, args.memory_mb if args.stream else None) for report in reports]
+        for future in as_completed(futures):
+            result = future.result()
+            if result['error']:
+                failed += 1
+                print(f"FAILED {result['report']}: {result['error']}")
+                continue
+            counts = ', '.join(f"{name}={value}" for name, value in result.items()
+                               if name.endswith('_lines'))
+            print(f"{result['report']}: {counts}, read {result['read_seconds']:.2f}s, "
+                  f"build {result['build_seconds']:.2f}s -> {result['output']}")
+
+    print(f"{len(reports) - failed}/{len(reports)} reports in {time.perf_counter() - started:.2f}s")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,239 @@
+import heapq
+import itertools
+import os
+import pickle
+import tempfile
+
+from stage_timing import stage
+
+# pandas, openpyxl and the pick list code are imported when a pick list is streamed, so
+# importing this module (e.g. for STREAM_THRESHOLD_MB) stays cheap
+
+# Memory (MB) a streamed build may use for order lines, whatever the size of the report
+STREAM_MEMORY_MB = float(os.environ.get('PICK_LIST_STREAM_MEMORY_MB', 256))
+
+# The web app streams reports of at least this many MB instead of loading them whole
+STREAM_THRESHOLD_MB = float(os.environ.get('PICK_LIST_STREAM_THRESHOLD_MB', 100))
+
+# Memory one buffered order line takes on its way through a chunk (frame, parsed SKU,
+# sort key), measured with tracemalloc; the budget divided by it gives the chunk size
+LINE_BYTES = 2000
+
+# Most sorted runs merged at once. The merge holds one block of every run it reads and
+# keeps their files open, so a block is chunk_lines // MERGE_FAN_IN lines and more runs
+# are first merged in passes of this many into longer ones.
+MERGE_FAN_IN = 64
+
+# Sort keys are (Style missing, Style, Color missing, Color, Size group, Size rank, Size,
+# line number); a new group in the second layout starts where this many leading
+# fields change
+GROUP_KEY_FIELDS = {
+    'style': 2,
+    'color': 4,
+    'size': 7,
+}
+
+# Fields of a sorted line after its sort key
+KEY_LENGTH = 8
+STYLE, COLOR, SIZE, QTY, FX5_STYLE = range(KEY_LENGTH, KEY_LENGTH + 5)
+
+
+def is_large_report(path):
+    # Reports big enough to be streamed rather than loaded whole
+    return os.path.getsize(path) >= STREAM_THRESHOLD_MB * 1024 * 1024
+
+
+def chunk_lines_for(memory_mb):
+    # Order lines per chunk (and per sorted run) within a memory budget
+    return max(1000, int(memory_mb * 1024 * 1024 // LINE_BYTES))
+
+
+def block_lines_for(chunk_lines):
+    # Order lines per block of a spilled run, so a merge of MERGE_FAN_IN runs holds at
+    # most one chunk's worth of lines
+    return max(1, chunk_lines // MERGE_FAN_IN)
+
+
+def sorted_lines(lines, fx5_styles, size_rank, first_line):
+    # The pick lines of one chunk as (sort key..., Style, Color, Size, Qty, Fx5 Style)
+    # tuples, sorted the way pick_list.build_pick_list sorts them: Style and Color
+    # alphabetically, Size in shelf order with unknown sizes alphabetically after,
+    # missing values last, equal lines in report order
+    import numpy as np
+    style, color, size = lines['Style'], lines['Color'], lines['Size']
+    rank = size.map(size_rank)
+    size_group = np.where(size.isna(), 2, np.where(rank.isna(), 1, 0))
+    keys = zip(
+        style.isna().tolist(), style.fillna('').tolist(),
+        color.isna().tolist(), color.fillna('').tolist(),
+        size_group.tolist(), rank.fillna(-1).astype(int).tolist(), size.where(size_group == 1, '').tolist(),
+        range(first_line, first_line + len(lines)),
+    )
+    # Missing values are written as NaN, as the categorical columns of the in-memory build are
+    values = zip(*(column.astype(object).where(column.notna(), np.nan).tolist() for column in (style, color, size)),
+                 lines['Qty'].tolist(), fx5_styles.tolist())
+    rows = [key + value for key, value in zip(keys, values)]
+    rows.sort()
+    return rows
+
+
+def spill_run(rows, folder, number, block_lines):
+    # Write sorted lines (a list, or any iterable such as a merge) to disk in blocks, so
+    # the merge reads them back a block at a time
+    path = os.path.join(folder, f'run-{number}.pickle')
+    rows = iter(rows)
+    with open(path, 'wb') as f:
+        while True:
+            block = list(itertools.islice(rows, block_lines))
+            if not block:
+                return path
+            pickle.dump(block, f, pickle.HIGHEST_PROTOCOL)
+
+
+def read_run(path):
+    with open(path, 'rb') as f:
+        while True:
+            try:
+                block = pickle.load(f)
+            except EOFError:
+                return
+            yield from block
+
+
+def merged_lines(runs):
+    # All order lines in sort order: an in-memory run as it is, spilled runs (at most
+    # MERGE_FAN_IN, see reduce_runs) merged from disk
+    if len(runs) == 1 and isinstance(runs[0], list):
+        return iter(runs[0])
+    return heapq.merge(*(read_run(path) for path in runs))
+
+
+def reduce_runs(runs, folder, block_lines):
+    # Merge spilled runs, MERGE_FAN_IN at a time, into longer ones until at most
+    # MERGE_FAN_IN are left, so the final merge stays within the memory and open-file limits
+    number = len(runs)
+    while len(runs) > MERGE_FAN_IN:
+        merged = []
+        for start in range(0, len(runs), MERGE_FAN_IN):
+            group = runs[start:start + MERGE_FAN_IN]
+            merged.append(spill_run(merged_lines(group), folder, number, block_lines))
+            number += 1
+            for path in group:
+                os.remove(path)
+        runs = merged
+    return runs
+
+
+def separated_lines(lines, group_by):
+    # Second layout rows of sorted lines, with None (a blank separator row) between groups
+    key_fields = GROUP_KEY_FIELDS.get(group_by, GROUP_KEY_FIELDS['style'])
+    previous = None
+    for line in lines:
+        group = line[:key_fields]
+        if previous is not None and group != previous:
+            yield None
+        previous = group
+        yield line[STYLE], line[COLOR], line[SIZE], line[QTY], ''
+
+
+def fold_totals(partials):
+    # Add up per-chunk Qty and Orders totals by Style/Color/Size
+    import pandas as pd
+    df = pd.concat(partials, ignore_index=True)
+    return df.groupby(['Style', 'Color', 'Size'], sort=False, dropna=False)[['Qty', 'Orders']].sum().reset_index()
+
+
+def build_pick_list_stream(source, output, today, group_by='style', consolidated=False,
+                           memory_mb=STREAM_MEMORY_MB, line_filter=None):
+    # The same workbook as pick_list.build_pick_list, built from a report (a path or a file
+    # object) read in chunks so memory stays within memory_mb however large it is.
+    # line_filter(df), if given, picks the order lines of each chunk that go on the pick list.
+    # - Layout 1 is written as the chunks are read, with a running total
+    # - consolidated, each chunk is added to Style/Color/Size totals, which then go through
+    #   the in-memory layout code (they grow with the distinct SKUs, not with the lines)
+    # - otherwise each chunk is sorted and spilled to disk as a run, and Layouts 2 and 3
+    #   are written from a merge of the runs
+    import pandas as pd
+    from order_report import read_order_line_chunks
+    from pick_list import LAYOUT_1_WIDTHS, as_categoricals, pick_lines, write_pick_layouts, layout_2_widths, layout_3_widths
+    from pick_list_writer import new_workbook, write_layout_sheet
+    from style_mapping import get_mappings, map_styles
+
+    chunk_lines = chunk_lines_for(memory_mb)
+    block_lines = block_lines_for(chunk_lines)
+    mappings = get_mappings()
+    size_rank = {size: rank for rank, size in enumerate(dict.fromkeys(mappings.size_order))}
+    counts = {'order_lines': 0, 'qty': 0}
+    runs = []
+    partials = []
+
+    with tempfile.TemporaryDirectory(prefix='pick-list-runs-') as spill_folder:
+
+        def order_lines():
+            # Layout 1 rows, chunk by chunk; the chunk's pick lines are set aside on the way
+            for df in read_order_line_chunks(source, chunk_lines):
+                if line_filter is not None:
+                    df = line_filter(df)
+                lines = pick_lines(df)
+                if consolidated:
+                    with stage('consolidate'):
+                        partials.append(lines.groupby(['Style', 'Color', 'Size'], sort=False, dropna=False)['Qty']
+                                        .agg(Qty='sum', Orders='size').reset_index())
+                        if sum(len(partial) for partial in partials) > chunk_lines:
+                            partials[:] = [fold_totals(partials)]
+                else:
+                    with stage('map_styles'):
+                        fx5_styles = map_styles(lines['Style'], lines['Size'], mappings)
+                    with stage('sort'):
+                        rows = sorted_lines(lines, fx5_styles, size_rank, counts['order_lines'])
+                        # A report that fits in one chunk is never spilled
+                        if runs and isinstance(runs[0], list):
+                            runs[0] = spill_run(runs[0], spill_folder, 0, block_lines)
+                        runs.append(spill_run(rows, spill_folder, len(runs), block_lines) if runs else rows)
+                counts['order_lines'] += len(df)
+                counts['qty'] += int(df['quantity-purchased'].sum())
+                yield from df.itertuples(index=False, name=None)
+
+        wb = new_workbook()
+
+        # Layout 1: order lines as read (the reading and the work on each chunk are timed as their own stages)
+        write_layout_sheet(wb, today, ['order-id', 'recipient-name', 'sku', 'Qty'], order_lines(),
+                           LAYOUT_1_WIDTHS, total_qty=lambda: counts['qty'])
+        run_count = len(runs)
+
+        if consolidated:
+            # Layouts 2 and 3 from the Style/Color/Size totals, sorted like the order lines would be
+            with stage('sort'):
+                totals = fold_totals(partials) if partials else pd.DataFrame(columns=['Style', 'Color', 'Size', 'Qty', 'Orders'])
+                totals = as_categoricals(totals, mappings.size_order)
+                totals = totals.sort_values(by=['Style', 'Color', 'Size']).reset_index(drop=True)
+                totals['Packs from #1 or No Inv.'] = ''
+            pick_line_count, fx5_line_count = write_pick_layouts(wb, today, totals, group_by, consolidated)
+        else:
+            with stage('merge_runs'):
+                runs = reduce_runs(runs, spill_folder, block_lines)
+
+            # Layout 2: style-grouped pick list with blank separator rows, from one merge of the runs
+            with stage('write_layout_2'):
+                write_layout_sheet(
+                    wb, f'{today}-', ['Style', 'Color', 'Size', 'Qty', 'Packs from #1 or No Inv.'],
+                    separated_lines(merged_lines(runs), group_by), layout_2_widths(consolidated),
+                    total_qty=counts['qty'])
+
+            # Layout 3: Fx5 reformatted styles, from a second merge
+            with stage('write_layout_3'):
+                write_layout_sheet(
+                    wb, 'Fx5Reformatted', ['Style', 'Color', 'Size', 'Qty'],
+                    ((line[FX5_STYLE], line[COLOR], line[SIZE], line[QTY]) for line in merged_lines(runs)),
+                    layout_3_widths(consolidated))
+            pick_line_count = fx5_line_count = counts['order_lines']
+
+        with stage('save'):
+            wb.save(output)
+
+    return {
+        'order_lines': counts['order_lines'],
+        'pick_lines': pick_line_count,
+        'fx5_lines': fx5_line_count,
+        'runs': run_count,
+    }
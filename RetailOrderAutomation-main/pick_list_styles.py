@@ -0,0 +1,52 @@
+from openpyxl.styles import NamedStyle, Font, Alignment, Border, Side
+from openpyxl.utils import get_column_letter
+
+# Names of the styles every layout uses
+HEADER = 'header'
+BODY = 'body'
+TOTAL = 'total'
+SEPARATOR = 'separator'
+
+
+def _named_styles():
+    # Build the style set; each workbook gets its own NamedStyle objects
+    thin_border = Border(left=Side(style='thin'), right=Side(style='thin'),
+                         top=Side(style='thin'), bottom=Side(style='thin'))
+    center_alignment = Alignment(horizontal='center')
+
+    return [
+        # Red color, bold, size 14
+        NamedStyle(name=HEADER, font=Font(color="FF0000", bold=True, size=14),
+                   border=thin_border, alignment=center_alignment),
+        # Data cells, size 14
+        NamedStyle(name=BODY, font=Font(color="000000", bold=False, size=14),
+                   border=thin_border, alignment=center_alignment),
+        # "Total" label and quantity, bold size 14
+        NamedStyle(name=TOTAL, font=Font(bold=True, size=14),
+                   border=thin_border, alignment=center_alignment),
+        # Blank rows between style groups keep the grid lines and row height
+        NamedStyle(name=SEPARATOR, font=Font(size=14),
+                   border=thin_border, alignment=center_alignment),
+    ]
+
+
+def register_styles(wb):
+    # Register the named styles once per workbook, cells then refer to them by name
+    existing = wb.named_styles
+    for style in _named_styles():
+        if style.name not in existing:
+            wb.add_named_style(style)
+    return wb
+
+
+def style_range(ws, style, min_row, max_row, min_col, max_col):
+    # Apply a registered style by reference to a block of cells
+    for row in ws.iter_rows(min_row=min_row, max_row=max_row, min_col=min_col, max_col=max_col):
+        for cell in row:
+            cell.style = style
+
+
+def set_column_widths(ws, column_widths):
+    # column_widths maps a 1-based column number to its width
+    for col, width in column_widths.items():
+        ws.column_dimensions[get_column_letter(col)].width = width
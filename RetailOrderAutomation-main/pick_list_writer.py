@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+
+from pick_list_styles import HEADER, BODY, TOTAL, SEPARATOR, register_styles, set_column_widths
+
+
+def new_workbook():
+    # Write-only workbook: rows are streamed to disk as they are appended
+    wb = Workbook(write_only=True)
+    return register_styles(wb)
+
+
+def group_starts(df, group_by):
+    # True for every row (after the first) whose group differs from the row above,
+    # compared on factorized integer codes so missing values group together
+    starts = np.zeros(len(df), dtype=bool)
+    for column in group_by:
+        codes = pd.factorize(df[column])[0]
+        starts[1:] |= codes[1:] != codes[:-1]
+    return starts
+
+
+def separated_rows(df, group_by=('Style',)):
+    # Rows of an already sorted frame as plain tuples, with None (a blank
+    # separator row) in front of each new group
+    starts = group_starts(df, group_by)
+    for start, row in zip(starts, df.itertuples(index=False, name=None)):
+        if start:
+            yield None
+        yield row
+
+
+def styled_cell(ws, value, style):
+    # Build a write-only cell that refers to one of the registered named styles
+    cell = WriteOnlyCell(ws, value=value)
+    cell.style = style
+    return cell
+
+
+def write_layout_sheet(wb, title, columns, rows, column_widths, total_qty=None, total_column=3):
+    # Create the sheet and set the column widths before any row is written
+    ws = wb.create_sheet(title=title)
+    set_column_widths(ws, column_widths)
+
+    # Header row
+    ws.append([styled_cell(ws, name, HEADER) for name in columns])
+
+    # Data rows, styled as they are emitted; None marks a blank separator row
+    separator = [''] * len(columns)
+    row_count = 0
+    for row in rows:
+        if row is None:
+            ws.append([styled_cell(ws, value, SEPARATOR) for value in separator])
+        else:
+            ws.append([styled_cell(ws, value, BODY) for value in row])
+        row_count += 1
+
+    # "Total" label and quantity, e.g. columns C and D; a callable total is asked for
+    # once the rows are written (a running total kept while they stream in)
+    if callable(total_qty):
+        total_qty = total_qty()
+    if total_qty is not None:
+        total_row = [None] * (total_column - 1)
+        total_row.append(styled_cell(ws, "Total", TOTAL))
+        total_row.append(styled_cell(ws, total_qty, TOTAL))
+        ws.append(total_row)
+
+    return row_count
@@ -0,0 +1,91 @@
+import cProfile
+import io
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+
+from stage_timing import add_stage_observer, remove_stage_observer
+
+# How many functions and allocation sites the readable profile lists
+TOP_FUNCTIONS = 40
+TOP_ALLOCATIONS = 25
+
+# File names of a profile, in the folder it was asked for (the job's directory)
+PROFILE_TEXT = 'profile.txt'
+PROFILE_STATS = 'profile.prof'
+
+# tracemalloc is process-wide, so profiled calls run one at a time
+_lock = threading.Lock()
+
+
+def profile_call(folder, fn, *args, **kwargs):
+    # Run fn(*args, **kwargs) under cProfile and tracemalloc and return its result. Writes
+    # profile.txt (top functions by own and cumulative time, top allocation sites) and
+    # profile.prof (the raw stats, for pstats or snakeviz) to folder, also when fn fails.
+    # Allocations of other jobs running at the same time are counted too.
+    with _lock:
+        profiler = cProfile.Profile()
+        thread = threading.get_ident()
+        # Allocation sites are listed as of the end of the pipeline stage (or of the call)
+        # that held the most memory. Snapshots are slow, so the profiler is paused and
+        # the wall time leaves them out.
+        fullest = {'stage': None, 'size': -1, 'snapshot': None, 'seconds': 0}
+
+        def take_snapshot(name):
+            size, _ = tracemalloc.get_traced_memory()
+            if size > fullest['size']:
+                started = time.perf_counter()
+                fullest.update(stage=name, size=size, snapshot=tracemalloc.take_snapshot())
+                fullest['seconds'] += time.perf_counter() - started
+
+        def observe_stage(name, seconds):
+            if threading.get_ident() == thread:
+                profiler.disable()
+                take_snapshot(f"'{name}'")
+                profiler.enable()
+
+        add_stage_observer(observe_stage)
+        tracemalloc.start()
+        started = time.perf_counter()
+        try:
+            profiler.enable()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                profiler.disable()
+                take_snapshot('the call')
+                elapsed = time.perf_counter() - started - fullest['seconds']
+                _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+            remove_stage_observer(observe_stage)
+            write_profile(folder, profiler, fullest['stage'], fullest['snapshot'], elapsed, peak)
+
+
+def write_profile(folder, profiler, stage, snapshot, elapsed, peak):
+    profiler.dump_stats(os.path.join(folder, PROFILE_STATS))
+
+    out = io.StringIO()
+    out.write(f"Wall time {elapsed:.3f}s (without memory snapshots), peak traced memory "
+              f"{peak / (1024 * 1024):.1f} MB\n\n")
+    stats = pstats.Stats(profiler, stream=out)
+    stats.strip_dirs()
+    out.write(f"Top {TOP_FUNCTIONS} functions by own time\n")
+    stats.sort_stats('tottime').print_stats(TOP_FUNCTIONS)
+    out.write(f"Top {TOP_FUNCTIONS} functions by cumulative time\n")
+    stats.sort_stats('cumulative').print_stats(TOP_FUNCTIONS)
+
+    # Memory held when it was at its fullest, by the line that allocated it
+    snapshot = snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap*>'),
+    ])
+    out.write(f"Top {TOP_ALLOCATIONS} allocation sites holding memory at the end of {stage}\n")
+    for stat in snapshot.statistics('lineno')[:TOP_ALLOCATIONS]:
+        frame = stat.traceback[0]
+        out.write(f"{stat.size / 1024:10.1f} KiB {stat.count:8d} blocks  {frame.filename}:{frame.lineno}\n")
+
+    with open(os.path.join(folder, PROFILE_TEXT), 'w', encoding='utf-8') as f:
+        f.write(out.getvalue())
@@ -0,0 +1,122 @@
+import hashlib
+import os
+import shutil
+import threading
+import time
+
+# Limits for the cache of generated workbooks: total size and age of an entry
+RESULT_CACHE_MAX_BYTES = int(os.environ.get('PICK_LIST_RESULT_CACHE_MAX_BYTES', 500 * 1024 * 1024))
+RESULT_CACHE_MAX_AGE = float(os.environ.get('PICK_LIST_RESULT_CACHE_MAX_AGE', 7 * 24 * 3600))
+
+
+# Files are hashed this many bytes at a time
+HASH_CHUNK_BYTES = 1024 * 1024
+
+
+def upload_key(data):
+    # Content address of an uploaded report
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_key(path):
+    # Content address of a report on disk, the same as upload_key of its bytes, read a
+    # chunk at a time so the file is never in memory whole
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def batch_key(upload_keys):
+    # Content address of several reports processed together, in upload order
+    if len(upload_keys) == 1:
+        return upload_keys[0]
+    return hashlib.sha256('\0'.join(upload_keys).encode('ascii')).hexdigest()
+
+
+def cache_key(upload, *parts):
+    # Content address of a workbook: the upload's key plus everything else that shapes
+    # the workbook (mapping version, build options, date)
+    digest = hashlib.sha256(upload.encode('ascii'))
+    for part in parts:
+        digest.update(b'\0' + str(part).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class ResultCache:
+    # Generated workbooks stored by content key as <key>.xlsx. An entry's mtime is its
+    # last use: hits touch it, entries older than max_age are dropped and, over max_bytes,
+    # the least recently used go first.
+
+    def __init__(self, folder, max_bytes=RESULT_CACHE_MAX_BYTES, max_age=RESULT_CACHE_MAX_AGE):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(folder, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.folder, f'{key}.xlsx')
+
+    def get(self, key):
+        # Path of the cached workbook, or None on a miss
+        path = self.path(key)
+        try:
+            age = time.time() - os.path.getmtime(path)
+            if age > self.max_age:
+                os.remove(path)
+                path = None
+            else:
+                os.utime(path)
+        except FileNotFoundError:
+            path = None
+
+        with self._lock:
+            if path is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return path
+
+    def put(self, key, output_filepath):
+        # Copy a finished workbook into the cache, swapped in whole so readers never see part of it
+        path = self.path(key)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        shutil.copyfile(output_filepath, tmp_path)
+        os.replace(tmp_path, path)
+        self.evict()
+        return path
+
+    def evict(self):
+        # Drop expired entries, then the least recently used until the cache fits in max_bytes
+        now = time.time()
+        entries = []
+        for entry in os.scandir(self.folder):
+            if not entry.name.endswith('.xlsx'):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for mtime, size, path in entries:
+            if now - mtime <= self.max_age and total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        return removed
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,108 @@
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from style_mapping import get_mappings, factorize
+
+# How many distinct SKUs stay parsed in memory between requests
+SKU_CACHE_SIZE = int(os.environ.get('PICK_LIST_SKU_CACHE_SIZE', 100000))
+
+# Fields kept per SKU: the parsed parts, the malformed flag and the mapped Style/Color/Size
+PARSED_FIELDS = ['Style', 'Color', 'Size', 'Other', 'Malformed']
+MAPPED_FIELDS = ['Mapped Style', 'Mapped Color', 'Mapped Size']
+
+
+def split_sku(sku, known_sizes):
+    # STYLE-COLOR-SIZE[-OTHER...], where the color itself may contain hyphens.
+    # The size is the right-most known size after the color; unknown sizes fall back to the third part.
+    parts = str(sku).strip().split('-')
+    if len(parts) < 3 or not parts[0]:
+        # Not enough parts to tell the color from the size
+        return parts[0] or None, parts[1] if len(parts) > 1 else None, None, '', True
+
+    size_index = 2
+    for i in range(len(parts) - 1, 1, -1):
+        if parts[i] in known_sizes:
+            size_index = i
+            break
+
+    color = '-'.join(parts[1:size_index])
+    return parts[0], color, parts[size_index], '-'.join(parts[size_index + 1:]), False
+
+
+def map_sku_parts(style, color, size, mappings):
+    # The mapping rules for a single SKU: plus sizes of the listed styles use their plus-size
+    # style (as map_styles does for a whole column), other styles, colors and sizes go through
+    # their tables or stay as they are
+    if size in mappings.plus_sizes and style in mappings.plus_size_styles:
+        mapped_style = mappings.plus_size_styles[style]
+    else:
+        mapped_style = mappings.styles.get(style, style)
+    return mapped_style, mappings.colors.get(color, color), mappings.sizes.get(size, size)
+
+
+class SkuCache:
+    # Bounded LRU of parsed and mapped SKUs, shared by every request in the process.
+    # Entries depend on the mappings (known sizes, style/color tables), so a mappings
+    # reload empties the cache.
+
+    def __init__(self, maxsize=SKU_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._mappings_key = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, skus, mappings):
+        # Return one entry per SKU, parsing only those not seen before
+        with self._lock:
+            if mappings.key != self._mappings_key:
+                self._entries.clear()
+                self._mappings_key = mappings.key
+
+            known_sizes = set(mappings.size_order) | set(mappings.plus_sizes) | set(mappings.sizes)
+            entries = []
+            for sku in skus:
+                entry = self._entries.get(sku)
+                if entry is None:
+                    self.misses += 1
+                    style, color, size, other, malformed = split_sku(sku, known_sizes)
+                    entry = (style, color, size, other, malformed) + map_sku_parts(style, color, size, mappings)
+                    self._entries[sku] = entry
+                    if len(self._entries) > self.maxsize:
+                        self._entries.popitem(last=False)
+                else:
+                    self.hits += 1
+                    self._entries.move_to_end(sku)
+                entries.append(entry)
+            return entries
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# One cache per process
+sku_cache = SkuCache()
+
+
+def parse_skus(skus, mappings=None):
+    # Split a SKU column into Style, Color, Size, Other, Malformed and the mapped
+    # Style/Color/Size. Each distinct SKU is parsed once; rows reuse it through the codes.
+    mappings = mappings or get_mappings()
+    codes, uniques = factorize(skus)
+    entries = sku_cache.lookup(uniques, mappings)
+
+    # A missing SKU (code -1) picks up the trailing malformed entry
+    entries.append((None, None, None, '', True, None, None, None))
+    table = np.empty((len(entries), len(PARSED_FIELDS) + len(MAPPED_FIELDS)), dtype=object)
+    table[:] = entries
+    rows = table[codes]
+
+    parsed = pd.DataFrame(rows, columns=PARSED_FIELDS + MAPPED_FIELDS, index=skus.index)
+    parsed['Malformed'] = parsed['Malformed'].astype(bool)
+    return parsed
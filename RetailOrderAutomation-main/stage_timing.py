@@ -0,0 +1,33 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# Callables told about every finished pipeline stage as observer(stage, seconds).
+# With none registered, a stage costs one list check.
+_observers = []
+_lock = threading.Lock()
+
+
+def add_stage_observer(observer):
+    with _lock:
+        _observers.append(observer)
+
+
+def remove_stage_observer(observer):
+    with _lock:
+        _observers.remove(observer)
+
+
+@contextmanager
+def stage(name):
+    # Time the enclosed block as one named pipeline stage (read, parse_skus, save, ...)
+    if not _observers:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        for observer in list(_observers):
+            observer(name, elapsed)
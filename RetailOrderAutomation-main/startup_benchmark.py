@@ -0,0 +1,67 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+APP_FOLDER = os.path.dirname(os.path.abspath(__file__))
+
+# Seconds from process start until each entry point is ready; over budget fails the run
+STARTUP_BUDGETS = {
+    'web': float(os.environ.get('PICK_LIST_WEB_STARTUP_BUDGET', 1.0)),
+    'cli': float(os.environ.get('PICK_LIST_CLI_STARTUP_BUDGET', 0.5)),
+}
+
+# Code each fresh interpreter runs: start the app and answer a first light request,
+# parse the CLI arguments, or (reported only) run the server warm-up hook
+STARTUP_TARGETS = {
+    'web': "import AmazonExcelToPickList as app; assert app.app.test_client().get('/cache').status_code == 200",
+    'cli': "import pick_list_cli; pick_list_cli.main(['--help'])",
+    'warm-up': "from pick_list import warm_up; warm_up()",
+}
+
+
+def time_startup(code, runs):
+    # Wall-clock times of fresh processes running code, in a scratch directory so the
+    # app's upload folders are not created next to the sources
+    env = dict(os.environ, PYTHONPATH=APP_FOLDER + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    timings = []
+    with tempfile.TemporaryDirectory() as scratch:
+        for _ in range(runs):
+            started = time.perf_counter()
+            subprocess.run([sys.executable, '-c', code], cwd=scratch, env=env, check=True,
+                           stdout=subprocess.DEVNULL)
+            timings.append(time.perf_counter() - started)
+    return timings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure process start to first-request-ready against a budget")
+    parser.add_argument('--runs', type=int, default=5, help="fresh processes per entry point")
+    parser.add_argument('--target', choices=sorted(STARTUP_TARGETS), action='append',
+                        help="entry points to measure (default all)")
+    args = parser.parse_args(argv)
+
+    # A throwaway run first, so the timings do not include cold disk caches
+    time_startup('pass', 1)
+
+    over_budget = []
+    for target in args.target or list(STARTUP_TARGETS):
+        timings = time_startup(STARTUP_TARGETS[target], args.runs)
+        median = statistics.median(timings)
+        budget = STARTUP_BUDGETS.get(target)
+        verdict = '' if budget is None else f" (budget {budget:.2f}s{', OVER' if median > budget else ''})"
+        print(f"{target}: median {median:.3f}s, min {min(timings):.3f}s, max {max(timings):.3f}s{verdict}")
+        if budget is not None and median > budget:
+            over_budget.append(target)
+
+    if over_budget:
+        print(f"Start-up over budget: {', '.join(over_budget)}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,128 @@
+import os
+import shutil
+import threading
+import time
+
+# Limits for everything kept under the upload folder: total size, and age since last use
+STORAGE_MAX_BYTES = int(os.environ.get('PICK_LIST_STORAGE_MAX_BYTES', 2 * 1024 * 1024 * 1024))
+STORAGE_MAX_AGE = float(os.environ.get('PICK_LIST_STORAGE_MAX_AGE', 14 * 24 * 3600))
+
+# How often (in seconds) the background sweep runs
+STORAGE_SWEEP_INTERVAL = float(os.environ.get('PICK_LIST_STORAGE_SWEEP_INTERVAL', 600))
+
+
+def tree_usage(path):
+    # Total size and latest mtime of the files under a directory
+    size = 0
+    last_used = os.path.getmtime(path)
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                stat = os.stat(os.path.join(dirpath, name))
+            except FileNotFoundError:
+                continue
+            size += stat.st_size
+            last_used = max(last_used, stat.st_mtime)
+    return size, last_used
+
+
+class StorageManager:
+    # Keeps the upload folder within max_bytes and max_age. Files directly in the folder,
+    # and files in its subfolders (cache, frames), are evicted one by one; each job
+    # directory (upload, output and status) goes as a whole. The least recently used
+    # go first, where last use is the latest mtime, which cache hits and downloads
+    # refresh. in_use(path) protects entries that are still being worked on.
+
+    def __init__(self, folder, max_bytes=STORAGE_MAX_BYTES, max_age=STORAGE_MAX_AGE,
+                 interval=STORAGE_SWEEP_INTERVAL, unit_folders=('jobs',), in_use=None):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.interval = interval
+        self.unit_folders = unit_folders
+        self.in_use = in_use or (lambda path: False)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stats = {
+            'sweeps': 0,
+            'files': 0,
+            'bytes': 0,
+            'evicted': 0,
+            'bytes_reclaimed': 0,
+            'last_sweep': None,
+        }
+
+    def entries(self):
+        # (last_used, size, path) for everything that can be evicted
+        entries = []
+        for entry in os.scandir(self.folder):
+            try:
+                if not entry.is_dir():
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    continue
+                for child in os.scandir(entry.path):
+                    if entry.name in self.unit_folders and child.is_dir():
+                        size, last_used = tree_usage(child.path)
+                        entries.append((last_used, size, child.path))
+                    elif child.is_file():
+                        stat = child.stat()
+                        entries.append((stat.st_mtime, stat.st_size, child.path))
+            except FileNotFoundError:
+                continue  # Removed while scanning
+        return entries
+
+    def sweep(self):
+        # Remove expired entries, then the least recently used until the folder fits in max_bytes
+        now = time.time()
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        evicted = 0
+        reclaimed = 0
+        for last_used, size, path in entries:
+            expired = now - last_used > self.max_age
+            if not expired and total <= self.max_bytes:
+                break
+            # Unfinished jobs and files being written are kept until they are long expired
+            if (self.in_use(path) or path.endswith('.tmp')) and now - last_used <= 2 * self.max_age:
+                continue
+            try:
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                else:
+                    os.remove(path)
+            except FileNotFoundError:
+                pass  # Already evicted by another process
+            total -= size
+            evicted += 1
+            reclaimed += size
+
+        with self._lock:
+            self._stats['sweeps'] += 1
+            self._stats['files'] = len(entries) - evicted
+            self._stats['bytes'] = total
+            self._stats['evicted'] += evicted
+            self._stats['bytes_reclaimed'] += reclaimed
+            self._stats['last_sweep'] = now
+        if evicted:
+            print(f"Storage sweep evicted {evicted} entries, {reclaimed} bytes from {self.folder}")
+        return evicted, reclaimed
+
+    def start(self):
+        # Start the sweep on a daemon thread, once per process; requests never wait on it
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='storage-sweep', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"Storage sweep failed: {e}")
+            time.sleep(self.interval)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
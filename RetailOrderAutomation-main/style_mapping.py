@@ -0,0 +1,140 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+# Style, plus-size, color and size mappings live in a versioned data file shared by every app
+MAPPINGS_FILE = os.environ.get(
+    'PICK_LIST_MAPPINGS', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mappings.json'))
+
+# How often (in seconds) a running process checks the mappings file for edits
+MAPPINGS_CHECK_INTERVAL = float(os.environ.get('PICK_LIST_MAPPINGS_CHECK_INTERVAL', 2))
+
+
+def compile_table(mapping):
+    # Turn a dict into a hashed lookup index plus its values, done once per table
+    keys = pd.Index(list(mapping.keys()), dtype=object)
+    values = np.array(list(mapping.values()), dtype=object)
+    return keys, values
+
+
+class CompiledMappings:
+    # The lookup tables built from one version of the mappings file
+
+    def __init__(self, data, digest):
+        self.version = data['version']
+        self.digest = digest
+        self.plus_sizes = list(data['plus_sizes'])
+        self.plus_size_styles = data['plus_size_styles']
+        self.styles = data['styles']
+        self.colors = data['colors']
+        self.sizes = data.get('sizes', {})
+        # Shelf order of sizes on the pick list
+        self.size_order = data.get('size_order', [])
+
+        self.plus_size_style_table = compile_table(self.plus_size_styles)
+        self.style_table = compile_table(self.styles)
+
+    @property
+    def key(self):
+        # Identifies the mapping contents, e.g. for caching generated workbooks
+        return f"v{self.version}-{self.digest[:12]}"
+
+
+class MappingStore:
+    # Loads the mappings file once, then reloads it only when its mtime/size and hash change
+
+    def __init__(self, path, check_interval=MAPPINGS_CHECK_INTERVAL):
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._mappings = None
+        self._stat = None
+        self._checked_at = 0.0
+
+    def get(self):
+        # Cheap on the hot path: the file is stat'ed at most once per check_interval
+        now = time.monotonic()
+        if self._mappings is not None and now - self._checked_at < self.check_interval:
+            return self._mappings
+
+        with self._lock:
+            if self._mappings is not None and now - self._checked_at < self.check_interval:
+                return self._mappings
+
+            try:
+                stat = os.stat(self.path)
+                signature = (stat.st_mtime_ns, stat.st_size)
+                if self._mappings is None or signature != self._stat:
+                    self._reload(signature)
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                # Missing, half-written or invalid file: keep serving the last good mappings
+                # and try again next interval; with none loaded yet there is nothing to serve
+                if self._mappings is None:
+                    raise
+                print(f"Could not reload mappings from {self.path}, keeping {self._mappings.key}: {e!r}")
+            self._checked_at = now
+            return self._mappings
+
+    def _reload(self, signature):
+        with open(self.path, 'rb') as f:
+            raw = f.read()
+        digest = hashlib.sha256(raw).hexdigest()
+
+        # Touched but unchanged (e.g. re-saved), keep the compiled tables
+        if self._mappings is not None and digest == self._mappings.digest:
+            self._stat = signature
+            return
+
+        mappings = CompiledMappings(json.loads(raw), digest)
+        if self._mappings is not None:
+            print(f"Reloaded mappings {self._mappings.key} -> {mappings.key}")
+        self._mappings = mappings
+        self._stat = signature
+
+
+# One store per process
+store = MappingStore(MAPPINGS_FILE)
+
+
+def get_mappings():
+    return store.get()
+
+
+def factorize(series):
+    # Integer codes and distinct values of a column; categorical columns already have both.
+    # Missing values get code -1, so every per-value array carries one extra trailing slot.
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series.cat.codes.to_numpy(), np.asarray(series.cat.categories, dtype=object)
+    codes, uniques = pd.factorize(series)
+    return codes, np.asarray(uniques, dtype=object)
+
+
+def lookup_values(uniques, table):
+    # Map distinct values through a compiled table, keeping values that have no entry
+    keys, values = table
+    if len(keys) == 0:
+        return np.append(uniques, np.nan), np.zeros(len(uniques) + 1, dtype=bool)
+    positions = keys.get_indexer(uniques)
+    mapped = np.where(positions >= 0, values[positions], uniques)
+    return np.append(mapped, np.nan), np.append(positions >= 0, False)
+
+
+def map_styles(styles, sizes, mappings=None):
+    # Plus sizes of the listed styles use their plus-size style,
+    # everything else goes through the style mapping (or stays as it is)
+    mappings = mappings or get_mappings()
+    style_codes, style_uniques = factorize(styles)
+    size_codes, size_uniques = factorize(sizes)
+
+    base, _ = lookup_values(style_uniques, mappings.style_table)
+    plus, has_plus_style = lookup_values(style_uniques, mappings.plus_size_style_table)
+    is_plus_size = np.append(pd.Index(size_uniques).isin(mappings.plus_sizes), False)
+
+    use_plus = has_plus_style[style_codes] & is_plus_size[size_codes]
+    mapped = np.where(use_plus, plus[style_codes], base[style_codes])
+    return pd.Series(mapped, index=styles.index, name=styles.name, dtype=object)
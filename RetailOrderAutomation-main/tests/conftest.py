@@ -0,0 +1,22 @@
+import os
+import sys
+
+import pytest
+
+# The app is a folder of flat modules run from its own directory; import them the same way
+APP_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_FOLDER)
+
+
+@pytest.fixture(scope='session')
+def web_folder(tmp_path_factory):
+    return tmp_path_factory.mktemp('web')
+
+
+@pytest.fixture
+def web_app(web_folder, monkeypatch):
+    # The pick list web app module, with its folders (kept relative to the working directory)
+    # in one temporary folder for the whole test run
+    monkeypatch.chdir(web_folder)
+    import AmazonExcelToPickList
+    return AmazonExcelToPickList
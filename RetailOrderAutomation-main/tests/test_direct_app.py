@@ -0,0 +1,41 @@
+import io
+from html.parser import HTMLParser
+
+from openpyxl import load_workbook
+
+from generate_reports import generate_report, write_tsv
+
+
+class FormParser(HTMLParser):
+    # The attributes of the page's form and of its inputs
+    def __init__(self):
+        super().__init__()
+        self.form = None
+        self.inputs = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'form':
+            self.form = dict(attrs)
+        elif tag == 'input':
+            self.inputs.append(dict(attrs))
+
+
+def test_index_form_posts_a_report_and_gets_the_workbook():
+    from script import app
+    client = app.test_client()
+    page = FormParser()
+    page.feed(client.get('/').get_data(as_text=True))
+    assert page.form['method'].upper() == 'POST'
+    assert page.form['enctype'] == 'multipart/form-data'
+    # A plain form post, no script expecting a JSON job back
+    assert '<script' not in client.get('/').get_data(as_text=True)
+
+    report = io.StringIO()
+    write_tsv(generate_report(40, seed=5), report)
+    file_input = next(attrs for attrs in page.inputs if attrs.get('type') == 'file')
+    response = client.post(page.form['action'], content_type='multipart/form-data',
+                           data={file_input['name']: (io.BytesIO(report.getvalue().encode('utf-8')), 'orders.txt')})
+    assert response.status_code == 200
+    assert response.headers['Content-Disposition'].startswith('attachment')
+    wb = load_workbook(io.BytesIO(response.data), read_only=True)
+    assert wb.sheetnames == ['Layout 1', 'Layout 2']
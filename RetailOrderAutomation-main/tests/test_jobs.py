@@ -0,0 +1,91 @@
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from jobs import JobQueue, QUEUED, RUNNING, DONE, FAILED, LOST_JOB_ERROR
+
+
+def dead_pid():
+    # The pid of a process that has exited
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+
+def write_job(queue, **fields):
+    # A job record as another process would have left it
+    job = queue.create(**fields)
+    with open(os.path.join(queue.job_dir(job['id']), 'job.json'), 'w', encoding='utf-8') as f:
+        json.dump(dict(job, **fields), f)
+    return job
+
+
+def test_job_of_exited_process_is_marked_failed(tmp_path):
+    queue = JobQueue(str(tmp_path))
+    job = write_job(queue, status=RUNNING, pid=dead_pid())
+    lost = queue.get(job['id'])
+    assert lost['status'] == FAILED
+    assert lost['error'] == LOST_JOB_ERROR
+    assert not queue.in_use(queue.job_dir(job['id']))
+
+
+def test_job_without_heartbeat_is_marked_failed(tmp_path):
+    # e.g. a process on another host sharing the folder
+    queue = JobQueue(str(tmp_path), stale_after=60)
+    job = write_job(queue, status=QUEUED, host='elsewhere', created=time.time() - 120)
+    queue.recover()
+    assert queue.get(job['id'])['status'] == FAILED
+
+
+def test_live_jobs_are_left_alone(tmp_path):
+    queue = JobQueue(str(tmp_path), heartbeat_interval=0.05, stale_after=0.5)
+    release = threading.Event()
+    job = queue.submit(queue.create(), release.wait, 10)
+    time.sleep(1)
+    assert queue.get(job['id'])['status'] == RUNNING
+    # Seen from another process serving the same folder, the heartbeat keeps it alive
+    assert JobQueue(str(tmp_path), stale_after=0.5).get(job['id'])['status'] == RUNNING
+
+    release.set()
+    for _ in range(100):
+        if queue.get(job['id'])['status'] == DONE:
+            break
+        time.sleep(0.05)
+    assert queue.get(job['id'])['status'] == DONE
+
+
+def test_heartbeat_moves_while_the_job_runs(tmp_path):
+    queue = JobQueue(str(tmp_path), heartbeat_interval=0.05, stale_after=60)
+    release = threading.Event()
+    job = queue.submit(queue.create(), release.wait, 10)
+    heartbeat = os.path.join(queue.job_dir(job['id']), 'heartbeat')
+    first = os.path.getmtime(heartbeat)
+    time.sleep(0.3)
+    assert os.path.getmtime(heartbeat) > first
+
+    release.set()
+    for _ in range(100):
+        if queue.get(job['id'])['status'] == DONE:
+            break
+        time.sleep(0.05)
+    # Finished: the heartbeat stops, and the job is not taken for lost
+    last = os.path.getmtime(heartbeat)
+    time.sleep(0.3)
+    assert os.path.getmtime(heartbeat) == last
+    assert JobQueue(str(tmp_path), stale_after=0.1).get(job['id'])['status'] == DONE
+
+
+def test_job_whose_heartbeat_stopped_is_marked_failed(tmp_path):
+    queue = JobQueue(str(tmp_path), stale_after=60)
+    job = write_job(queue, status=RUNNING, host='elsewhere')
+    heartbeat = os.path.join(queue.job_dir(job['id']), 'heartbeat')
+    with open(heartbeat, 'w'):
+        pass
+    assert queue.get(job['id'])['status'] == RUNNING
+    os.utime(heartbeat, (time.time() - 120, time.time() - 120))
+    lost = queue.get(job['id'])
+    assert lost['status'] == FAILED
+    assert lost['error'] == LOST_JOB_ERROR
@@ -0,0 +1,45 @@
+import json
+import os
+import threading
+
+from metrics import MetricsRegistry, RETIRED_FILE, read_counts, retire_process, write_counts
+
+
+def process_files(folder):
+    return sorted(name for name in os.listdir(folder) if name.endswith('.json') and name != RETIRED_FILE)
+
+
+def test_flush_is_throttled_between_requests(tmp_path):
+    registry = MetricsRegistry(str(tmp_path), flush_interval=60)
+    registry.inc('pick_list_jobs_total', status='done')
+    registry.maybe_flush()
+    assert process_files(tmp_path) == []
+    # A scrape writes the counts out however recently they were written
+    assert 'pick_list_jobs_total{status="done"} 1' in registry.render()
+    path = os.path.join(tmp_path, f'{os.getpid()}.json')
+    written = os.stat(path).st_mtime_ns
+    registry.inc('pick_list_jobs_total', status='done')
+    registry.maybe_flush()
+    assert os.stat(path).st_mtime_ns == written
+
+
+def test_flush_without_changes_writes_nothing(tmp_path):
+    registry = MetricsRegistry(str(tmp_path), flush_interval=0)
+    registry.maybe_flush()
+    assert process_files(tmp_path) == []
+
+
+def test_concurrent_retires_keep_every_count(tmp_path):
+    folder = str(tmp_path)
+    pids = range(100000, 100040)
+    for pid in pids:
+        write_counts(os.path.join(folder, f'{pid}.json'),
+                     {'counters': {'pick_list_jobs_total{status="done"}': 1}, 'histograms': {}})
+    threads = [threading.Thread(target=retire_process, args=(pid, folder)) for pid in pids]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert process_files(folder) == []
+    retired = read_counts(os.path.join(folder, RETIRED_FILE))
+    assert retired['counters'] == {'pick_list_jobs_total{status="done"}': len(pids)}
@@ -0,0 +1,35 @@
+import io
+
+import pandas as pd
+
+from order_report import read_order_lines, read_order_line_chunks
+
+HEADER = 'order-id\trecipient-name\tsku\tquantity-purchased\n'
+
+
+def cp1252_report(lines=3):
+    # The header and the first lines are ASCII; the accented names come later
+    rows = [f'111-{n}\tAnn Lee\tMK1-BLK-S\t1\n' for n in range(lines)]
+    rows.append('111-9\tJosé Peña\tMK1-BLK-M\t2\n')
+    return (HEADER + ''.join(rows)).encode('cp1252')
+
+
+def test_cp1252_report_with_non_ascii_names():
+    df = read_order_lines(io.BytesIO(cp1252_report()))
+    assert df['recipient-name'].tolist()[-1] == 'José Peña'
+    assert df['quantity-purchased'].sum() == 5
+
+
+def test_cp1252_report_in_chunks(tmp_path):
+    # Past the first block of the encoding check and over several chunks
+    path = tmp_path / 'orders.txt'
+    path.write_bytes(cp1252_report(lines=60000))
+    df = pd.concat(read_order_line_chunks(str(path), 1000), ignore_index=True)
+    assert len(df) == 60001
+    assert df['recipient-name'].iloc[-1] == 'José Peña'
+
+
+def test_utf8_report():
+    data = '﻿' + HEADER + '111-1\tZoë Ørsted\tMK1-BLK-S\t1\n'
+    df = read_order_lines(io.BytesIO(data.encode('utf-8')))
+    assert df['recipient-name'].tolist() == ['Zoë Ørsted']
@@ -0,0 +1,75 @@
+import pandas as pd
+from openpyxl import load_workbook
+
+from pick_list import GROUP_BY_OPTIONS, build_pick_list, size_dtype
+from pick_list_writer import new_workbook, separated_rows
+
+
+def order_lines(skus, qty=1):
+    # Order lines as read_order_lines returns them
+    return pd.DataFrame({
+        'order-id': [f'111-{n:07d}' for n in range(len(skus))],
+        'recipient-name': ['Customer'] * len(skus),
+        'sku': skus,
+        'quantity-purchased': [qty] * len(skus),
+    })
+
+
+def sheet_rows(path, index):
+    return list(load_workbook(path).worksheets[index].iter_rows(values_only=True))
+
+
+def test_pick_list_is_written_in_one_pass(tmp_path):
+    assert new_workbook().write_only
+    path = tmp_path / 'pick.xlsx'
+    result = build_pick_list(order_lines(['MK1-BLK-M', 'MK1-BLK-S', 'MK2-RED-L'], qty=2), str(path), '20260101')
+    assert result == {'order_lines': 3, 'pick_lines': 3, 'fx5_lines': 3}
+
+    wb = load_workbook(path)
+    assert wb.sheetnames == ['20260101', '20260101-', 'Fx5Reformatted']
+    layout_1 = sheet_rows(path, 0)
+    assert layout_1[0] == ('order-id', 'recipient-name', 'sku', 'Qty')
+    assert layout_1[-1] == (None, None, 'Total', 6)
+    assert wb.worksheets[0]['A1'].font.bold
+    assert wb.worksheets[0].column_dimensions['A'].width == 30
+
+
+SORTED_LINES = pd.DataFrame({
+    'Style': ['MK1', 'MK1', 'MK1', 'MK1', 'MK2'],
+    'Color': ['BLK', 'BLK', 'BLK', 'RED', 'RED'],
+    'Size': ['S', 'S', 'M', 'M', 'M'],
+})
+
+
+def separator_positions(group_by):
+    rows = list(separated_rows(SORTED_LINES, GROUP_BY_OPTIONS[group_by]))
+    assert [row for row in rows if row is not None] == list(SORTED_LINES.itertuples(index=False, name=None))
+    return [n for n, row in enumerate(rows) if row is None]
+
+
+def test_blank_row_before_each_group():
+    assert separator_positions('style') == [4]
+    assert separator_positions('color') == [3, 5]
+    assert separator_positions('size') == [2, 4, 6]
+
+
+def test_blank_rows_in_the_second_layout(tmp_path):
+    path = tmp_path / 'pick.xlsx'
+    build_pick_list(order_lines(['MK2-RED-M', 'MK1-BLK-S', 'MK1-RED-M', 'MK1-BLK-M']), str(path), '20260101', 'color')
+    layout_2 = [row[:3] for row in sheet_rows(path, 1)[1:-1]]
+    blank = (None, None, None)
+    assert layout_2 == [('MK1', 'BLK', 'S'), ('MK1', 'BLK', 'M'), blank, ('MK1', 'RED', 'M'), blank, ('MK2', 'RED', 'M')]
+
+
+def test_sizes_in_shelf_order_with_unknown_sizes_last():
+    sizes = pd.Series(['XL', 'ZZ', 'S', '1X', None, 'AB', 'M'])
+    dtype = size_dtype(sizes, ['S', 'M', 'L', 'XL', '1X'])
+    assert list(dtype.categories) == ['S', 'M', 'L', 'XL', '1X', 'AB', 'ZZ']
+    assert sizes.astype(dtype).sort_values().tolist()[:-1] == ['S', 'M', 'XL', '1X', 'AB', 'ZZ']
+
+
+def test_pick_lines_sorted_by_shelf_size(tmp_path):
+    path = tmp_path / 'pick.xlsx'
+    build_pick_list(order_lines(['MK1-BLK-XL', 'MK1-BLK-ODD', 'MK1-BLK-1X', 'MK1-BLK-XS', 'MK1-BLK-M']),
+                    str(path), '20260101')
+    assert [row[2] for row in sheet_rows(path, 1)[1:-1]] == ['XS', 'M', 'XL', '1X', 'ODD']
@@ -0,0 +1,21 @@
+import os
+
+from generate_reports import generate_report, write_tsv, write_xlsx
+from pick_list_cli import main
+
+
+def test_corrupt_report_does_not_stop_the_batch(tmp_path, capsys):
+    reports = tmp_path / 'reports'
+    reports.mkdir()
+    write_xlsx(generate_report(50, seed=1), str(reports / 'a.xlsx'))
+    write_tsv(generate_report(50, seed=2), str(reports / 'b.txt'))
+    # A zip signature with nothing behind it: openpyxl raises BadZipFile
+    (reports / 'corrupt.xlsx').write_bytes(b'PK\x03\x04' + b'\x00' * 100)
+    output = tmp_path / 'out'
+
+    assert main([str(reports), '-o', str(output), '-j', '2']) == 1
+
+    out = capsys.readouterr().out
+    assert 'FAILED' in out and 'corrupt.xlsx' in out
+    assert '2/3 reports' in out
+    assert sorted(os.listdir(output)) == ['a.xlsx - Pick List.xlsx', 'b.txt - Pick List.xlsx']
@@ -0,0 +1,46 @@
+import random
+import tracemalloc
+
+import pick_list_stream
+from pick_list_stream import block_lines_for, merged_lines, reduce_runs, spill_run
+
+CHUNK_LINES = 1000
+
+
+def sorted_run(rng, first_line):
+    # One chunk's sorted lines, shaped like sorted_lines() output
+    rows = [(False, f'MK{rng.randrange(9000):04d}', False, rng.choice(['BLK', 'NAVY', 'RED']), 0,
+             rng.randrange(8), '', first_line + i, 'MK', 'BLK', 'M', 1, 'MK-FX5') for i in range(CHUNK_LINES)]
+    rows.sort()
+    return rows
+
+
+def merge_peak(tmp_path, run_count):
+    # Peak traced memory of merging run_count spilled runs, and the merged line count
+    rng = random.Random(run_count)
+    block_lines = block_lines_for(CHUNK_LINES)
+    runs = [spill_run(sorted_run(rng, i * CHUNK_LINES), str(tmp_path), i, block_lines) for i in range(run_count)]
+    tracemalloc.start()
+    try:
+        previous = None
+        count = 0
+        for line in merged_lines(reduce_runs(runs, str(tmp_path), block_lines)):
+            assert previous is None or previous <= line
+            previous = line
+            count += 1
+        return tracemalloc.get_traced_memory()[1], count
+    finally:
+        tracemalloc.stop()
+
+
+def test_merge_memory_does_not_grow_with_the_runs(tmp_path, monkeypatch):
+    monkeypatch.setattr(pick_list_stream, 'MERGE_FAN_IN', 8)
+    (tmp_path / 'one_pass').mkdir()
+    (tmp_path / 'three_passes').mkdir()
+    one_pass, one_pass_lines = merge_peak(tmp_path / 'one_pass', 8)
+    three_passes, three_passes_lines = merge_peak(tmp_path / 'three_passes', 100)
+    assert one_pass_lines == 8 * CHUNK_LINES
+    assert three_passes_lines == 100 * CHUNK_LINES
+    # 100 runs are merged 8 at a time, one block of each (an eighth of a chunk) in memory,
+    # so the merge holds no more than for 8 runs, not a block of every run
+    assert three_passes < 1.5 * one_pass
@@ -0,0 +1,42 @@
+import os
+import time
+
+from result_cache import ResultCache, cache_key
+
+
+def workbook(tmp_path, name, size):
+    path = tmp_path / name
+    path.write_bytes(b'x' * size)
+    return str(path)
+
+
+def age(path, seconds):
+    then = time.time() - seconds
+    os.utime(path, (then, then))
+
+
+def test_least_recently_used_entries_go_first(tmp_path):
+    cache = ResultCache(str(tmp_path / 'cache'), max_bytes=250)
+    age(cache.put('a', workbook(tmp_path, 'a.xlsx', 100)), 30)
+    age(cache.put('b', workbook(tmp_path, 'b.xlsx', 100)), 20)
+    # Reading "a" makes it the most recently used, so "b" goes when "c" puts the cache over
+    assert cache.get('a') is not None
+    cache.put('c', workbook(tmp_path, 'c.xlsx', 100))
+    assert cache.get('b') is None
+    assert cache.get('a') is not None and cache.get('c') is not None
+    assert cache.stats() == {'hits': 3, 'misses': 1}
+
+
+def test_expired_entries_are_misses(tmp_path):
+    cache = ResultCache(str(tmp_path / 'cache'), max_age=60)
+    age(cache.put('a', workbook(tmp_path, 'a.xlsx', 10)), 120)
+    assert cache.get('a') is None
+    assert not os.path.exists(cache.path('a'))
+
+
+def test_key_covers_every_build_option():
+    keys = {cache_key('upload', 3, '20260101', group_by, consolidated)
+            for group_by in ('style', 'color') for consolidated in (False, True)}
+    keys.add(cache_key('upload', 4, '20260101', 'style', False))
+    keys.add(cache_key('upload', 3, '20260102', 'style', False))
+    assert len(keys) == 6
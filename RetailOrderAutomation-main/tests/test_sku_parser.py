@@ -0,0 +1,29 @@
+import pandas as pd
+
+from sku_parser import parse_skus
+from style_mapping import CompiledMappings
+
+MAPPINGS = CompiledMappings({
+    'version': 1,
+    'plus_sizes': ['1X', '2X'],
+    'plus_size_styles': {'MK1': 'MK1P'},
+    'styles': {'MK1': 'MK1-FX5'},
+    'colors': {'BLK': 'BLACK'},
+    'sizes': {'S/M': 'SM'},
+    'size_order': ['S', 'M', 'L', '1X', '2X'],
+}, 'test-digest')
+
+
+def test_mapping_rules_per_sku():
+    parsed = parse_skus(pd.Series(['MK1-BLK-M-BD', 'MK1-BLK-1X', 'MK2-NAVY-S/M', 'MK1-DARK-RED-L', 'MK9']), MAPPINGS)
+    mapped = parsed[['Mapped Style', 'Mapped Color', 'Mapped Size']].values.tolist()
+    assert mapped[:4] == [
+        ['MK1-FX5', 'BLACK', 'M'],   # style and color tables
+        ['MK1P', 'BLACK', '1X'],     # plus size of a listed style
+        ['MK2', 'NAVY', 'SM'],       # size table, unmapped style and color kept
+        ['MK1-FX5', 'DARK-RED', 'L'],
+    ]
+    assert parsed['Other'].iloc[0] == 'BD'
+    # Too few parts: flagged, the style still mapped
+    assert parsed['Malformed'].tolist() == [False, False, False, False, True]
+    assert mapped[4][0] == 'MK9'
@@ -0,0 +1,25 @@
+import time
+
+import pytest
+
+from stage_timing import add_stage_observer, remove_stage_observer, stage
+
+
+def test_observers_get_each_finished_stage():
+    seen = []
+    observer = lambda name, seconds: seen.append((name, seconds))
+    add_stage_observer(observer)
+    try:
+        with stage('parse_skus'):
+            time.sleep(0.01)
+        # A stage that raises is still reported
+        with pytest.raises(ValueError):
+            with stage('save'):
+                raise ValueError
+    finally:
+        remove_stage_observer(observer)
+    with stage('sort'):
+        pass
+
+    assert [name for name, _ in seen] == ['parse_skus', 'save']
+    assert seen[0][1] >= 0.01
@@ -0,0 +1,28 @@
+import os
+import statistics
+import subprocess
+import sys
+
+from startup_benchmark import APP_FOLDER, STARTUP_BUDGETS, STARTUP_TARGETS, time_startup
+
+# Modules an entry point only imports once it has a report to build
+HEAVY_MODULES = ('pandas', 'numpy', 'openpyxl')
+
+# Prefixed to an entry point's code: prints the heavy modules it imported, last, however it exits
+PRINT_HEAVY_MODULES = f"""
+import atexit, sys
+atexit.register(lambda: print('loaded:', *[m for m in {HEAVY_MODULES!r} if m in sys.modules]))
+"""
+
+
+def test_entry_points_start_without_pandas(tmp_path):
+    env = dict(os.environ, PYTHONPATH=APP_FOLDER)
+    for target in STARTUP_BUDGETS:
+        out = subprocess.run([sys.executable, '-c', PRINT_HEAVY_MODULES + STARTUP_TARGETS[target]],
+                             cwd=str(tmp_path), env=env, capture_output=True, text=True).stdout
+        assert out.splitlines()[-1] == 'loaded:', target
+
+
+def test_entry_points_start_within_budget():
+    for target, budget in STARTUP_BUDGETS.items():
+        assert statistics.median(time_startup(STARTUP_TARGETS[target], 3)) <= budget, target
@@ -0,0 +1,46 @@
+import json
+import os
+import shutil
+
+import pytest
+
+from style_mapping import MAPPINGS_FILE, MappingStore
+
+
+def edit(path, text):
+    # Write the file and move its mtime on, so the store sees a new signature
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+
+def test_corrupt_edit_keeps_last_good_mappings(tmp_path):
+    path = tmp_path / 'mappings.json'
+    shutil.copy(MAPPINGS_FILE, path)
+    store = MappingStore(str(path), check_interval=0)
+    good = store.get()
+
+    # Half-written file: the last good mappings are served
+    edit(path, '{"version": ')
+    assert store.get() is good
+
+    # Missing file: the same
+    os.remove(path)
+    assert store.get() is good
+
+    # Fixed: the new version is loaded on the next check
+    with open(MAPPINGS_FILE, encoding='utf-8') as f:
+        data = json.load(f)
+    data['version'] = good.version + 1
+    edit(path, json.dumps(data))
+    fixed = store.get()
+    assert fixed is not good
+    assert fixed.version == good.version + 1
+
+
+def test_invalid_file_without_good_mappings_raises(tmp_path):
+    path = tmp_path / 'mappings.json'
+    edit(path, 'not json')
+    with pytest.raises(ValueError):
+        MappingStore(str(path), check_interval=0).get()
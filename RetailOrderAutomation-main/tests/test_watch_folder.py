@@ -0,0 +1,60 @@
+import hashlib
+import io
+import os
+
+import pick_list_stream
+from generate_reports import generate_report, write_tsv
+from order_report import read_order_lines
+from watch_folder import InboxWatcher, read_index
+
+
+def watcher(tmp_path):
+    return InboxWatcher(str(tmp_path / 'inbox'), str(tmp_path / 'outbox'), str(tmp_path / 'uploads'),
+                        ledger_path=str(tmp_path / 'ledger.sqlite3'))
+
+
+def poll_twice(watcher):
+    # A report is picked up on the scan after the one that first saw it
+    return watcher.poll() + watcher.poll()
+
+
+def test_corrupt_report_is_filed_as_failed(tmp_path):
+    inbox = watcher(tmp_path)
+    (tmp_path / 'inbox' / 'corrupt.xlsx').write_bytes(b'PK\x03\x04' + b'\x00' * 100)
+    write_tsv(generate_report(50, seed=1), str(tmp_path / 'inbox' / 'good.txt'))
+
+    assert poll_twice(inbox) == 1
+
+    failed = tmp_path / 'inbox' / 'failed'
+    assert sorted(os.listdir(failed)) == ['corrupt.xlsx', 'corrupt.xlsx.error']
+    assert 'BadZipFile' in (failed / 'corrupt.xlsx.error').read_text(encoding='utf-8')
+    assert os.listdir(tmp_path / 'inbox' / 'processed') == ['good.txt']
+    assert 'good.txt - Pick List.xlsx' in os.listdir(tmp_path / 'outbox')
+    # Nothing left to trip over on the next scan
+    assert poll_twice(inbox) == 0
+
+
+def test_report_without_header_is_filed_as_failed(tmp_path):
+    inbox = watcher(tmp_path)
+    (tmp_path / 'inbox' / 'notes.txt').write_text('hello\tworld\n', encoding='utf-8')
+    assert poll_twice(inbox) == 0
+    note = (tmp_path / 'inbox' / 'failed' / 'notes.txt.error').read_text(encoding='utf-8')
+    assert 'missing columns' in note
+
+
+def test_large_report_is_streamed_and_recorded(tmp_path, monkeypatch):
+    monkeypatch.setattr(pick_list_stream, 'STREAM_THRESHOLD_MB', 0.01)
+    inbox = watcher(tmp_path)
+    path = tmp_path / 'inbox' / 'quarter.txt'
+    write_tsv(generate_report(300, seed=3), str(path))
+    data = path.read_bytes()
+
+    assert poll_twice(inbox) == 1
+
+    index = read_index(str(tmp_path / 'outbox'))
+    result = index[hashlib.sha256(data).hexdigest()]
+    assert result['order_lines'] == 300
+    assert 'runs' in result  # built by the streaming path
+    # The lines are in the ledger, so a new-only run of the same report has nothing left
+    with inbox.ledger.run() as run:
+        assert len(run.add(read_order_lines(io.BytesIO(data)), new_only=True)) == 0
@@ -0,0 +1,149 @@
+import hashlib
+import io
+import os
+import time
+
+import pick_list_stream
+from generate_reports import generate_report, write_tsv
+from watch_folder import InboxWatcher
+
+
+def report_bytes(lines, seed):
+    buffer = io.StringIO()
+    write_tsv(generate_report(lines, seed=seed), buffer)
+    return buffer.getvalue().encode('utf-8')
+
+
+def upload(client, data, filename='orders.txt', **form):
+    form['file'] = (io.BytesIO(data), filename)
+    response = client.post('/upload', data=form, content_type='multipart/form-data')
+    assert response.status_code in (200, 202), response.data
+    return response.get_json()
+
+
+def wait_for_job(client, job):
+    for _ in range(600):
+        job = client.get(job['status_url']).get_json()
+        if job['status'] in ('done', 'failed'):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"job {job['id']} did not finish")
+
+
+def test_upload_is_stored_and_hashed_in_chunks(web_app, monkeypatch):
+    # A report larger than one copy chunk, and over the (lowered) streaming threshold
+    monkeypatch.setattr(web_app, 'UPLOAD_CHUNK_BYTES', 4096)
+    monkeypatch.setattr(pick_list_stream, 'STREAM_THRESHOLD_MB', 0.01)
+    data = report_bytes(300, seed=101)
+    client = web_app.app.test_client()
+
+    job = wait_for_job(client, upload(client, data))
+    assert job['status'] == 'done', job['error']
+    assert job['source_key'] == hashlib.sha256(data).hexdigest()
+    assert job['result']['runs'] == 1  # built by the streaming path
+    with open(job['sources'][0], 'rb') as f:
+        assert f.read() == data
+    assert os.listdir(web_app.INCOMING_FOLDER) == []
+
+
+def forget_lines(web_app):
+    # Empty the ledger, as if the report had never been picked
+    db = web_app.ledger.connect()
+    try:
+        db.execute('DELETE FROM order_lines')
+    finally:
+        db.close()
+
+
+def test_cached_workbook_records_its_lines(web_app):
+    data = report_bytes(200, seed=102)
+    client = web_app.app.test_client()
+    assert wait_for_job(client, upload(client, data))['status'] == 'done'
+
+    # The repeat upload is served from the result cache, and still records the lines
+    forget_lines(web_app)
+    cached = wait_for_job(client, upload(client, data))
+    assert cached['status'] == 'done', cached['error']
+    assert cached['result'] == {'cached': True}
+
+    new_only = wait_for_job(client, upload(client, data, new_only='on'))
+    assert new_only['status'] == 'done', new_only['error']
+    assert new_only['result']['skipped_lines'] == 200
+    assert new_only['result']['order_lines'] == 0
+
+
+def test_inbox_report_records_its_lines(web_app, web_folder):
+    data = report_bytes(150, seed=103)
+    watcher = InboxWatcher(str(web_folder / 'inbox'), str(web_folder / 'outbox'), web_app.UPLOAD_FOLDER,
+                           ledger_path=web_app.ledger.path)
+    with open(os.path.join(watcher.inbox, 'orders.txt'), 'wb') as f:
+        f.write(data)
+    assert watcher.poll() + watcher.poll() == 1
+
+    client = web_app.app.test_client()
+    new_only = wait_for_job(client, upload(client, data, new_only='on'))
+    assert new_only['status'] == 'done', new_only['error']
+    assert new_only['result']['skipped_lines'] == 150
+    assert new_only['result']['order_lines'] == 0
+
+
+def test_upload_without_a_file_is_a_client_error(web_app):
+    # The upload page shows the text of any response that is not ok
+    client = web_app.app.test_client()
+    response = client.post('/upload', data={}, content_type='multipart/form-data')
+    assert response.status_code == 400
+    assert response.get_data(as_text=True) == 'No file part'
+    response = client.post('/upload', data={'file': (io.BytesIO(b''), '')}, content_type='multipart/form-data')
+    assert response.status_code == 400
+    assert response.get_data(as_text=True) == 'No selected file'
+
+
+def metric_values(text):
+    # Series -> value of a Prometheus text exposition, in the order served
+    values = {}
+    for line in text.splitlines():
+        if line and not line.startswith('#'):
+            series, value = line.rsplit(' ', 1)
+            values[series] = float(value)
+    return values
+
+
+def test_metrics_are_served_in_prometheus_text_format(web_app):
+    client = web_app.app.test_client()
+    before = metric_values(client.get('/metrics').get_data(as_text=True))
+    for _ in range(2):
+        assert client.get('/cache').status_code == 200
+
+    response = client.get('/metrics')
+    assert response.mimetype == 'text/plain'
+    text = response.get_data(as_text=True)
+    assert '# TYPE pick_list_requests_total counter' in text.splitlines()
+    assert '# TYPE pick_list_request_seconds histogram' in text.splitlines()
+
+    after = metric_values(text)
+    requests = 'pick_list_requests_total{endpoint="cache_stats",status="200"}'
+    assert after[requests] - before.get(requests, 0) == 2
+    # Buckets are cumulative, ending with +Inf at the request count
+    buckets = [value for series, value in after.items()
+               if series.startswith('pick_list_request_seconds_bucket{endpoint="cache_stats",')]
+    assert buckets == sorted(buckets)
+    assert after['pick_list_request_seconds_bucket{endpoint="cache_stats",le="+Inf"}'] == buckets[-1]
+    assert buckets[-1] == after['pick_list_request_seconds_count{endpoint="cache_stats"}']
+
+
+def test_profiling_needs_the_admin_token(web_app, monkeypatch):
+    monkeypatch.setitem(web_app.app.config, 'ADMIN_TOKEN', 'secret')
+    client = web_app.app.test_client()
+    data = report_bytes(50, seed=104)
+    form = {'file': (io.BytesIO(data), 'orders.txt')}
+    response = client.post('/upload?profile=1', data=form, content_type='multipart/form-data')
+    assert response.status_code == 403
+
+    form = {'file': (io.BytesIO(data), 'orders.txt')}
+    response = client.post('/upload?profile=1', data=form, content_type='multipart/form-data',
+                           headers={'X-Admin-Token': 'secret'})
+    job = wait_for_job(client, response.get_json())
+    assert job['status'] == 'done', job['error']
+    assert client.get(job['profile_url']).status_code == 403
+    assert client.get(job['profile_url'], headers={'X-Admin-Token': 'wrong'}).status_code == 403
+    assert client.get(job['profile_url'], headers={'X-Admin-Token': 'secret'}).status_code == 200
@@ -0,0 +1,194 @@
+import argparse
+import json
+import os
+import shutil
+import threading
+import time
+import traceback
+from datetime import datetime
+
+from order_report import read_order_lines, ReportFormatError
+from result_cache import ResultCache, cache_key, file_key
+from frame_cache import FrameCache
+from order_ledger import OrderLedger, LEDGER_PATH
+from pick_list_stream import is_large_report
+
+# Where the scheduled download drops reports, and where their pick lists are filed
+INBOX_FOLDER = os.environ.get('PICK_LIST_INBOX', 'inbox')
+OUTBOX_FOLDER = os.environ.get('PICK_LIST_OUTBOX', 'outbox')
+
+# How often (in seconds) the inbox is scanned; a report is picked up once its size and
+# mtime have not changed for a whole interval
+WATCH_INTERVAL = float(os.environ.get('PICK_LIST_WATCH_INTERVAL', 5))
+
+# Files picked up from the inbox
+REPORT_EXTENSIONS = ('.xls', '.xlsx', '.txt', '.tsv', '.csv')
+
+# Pick lists are pre-built with the web app's default options
+DEFAULT_GROUP_BY = 'style'
+DEFAULT_CONSOLIDATED = False
+
+
+def read_index(outbox):
+    # Reports already filed in the outbox, by content key
+    try:
+        with open(os.path.join(outbox, 'index.json'), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def write_index(outbox, index):
+    path = os.path.join(outbox, 'index.json')
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f, indent=1)
+    os.replace(tmp_path, path)
+
+
+class InboxWatcher:
+    # Polls the inbox and turns every new report into a pick list in the outbox.
+    # Processed reports move to inbox/processed, duplicates (same content as a report
+    # already filed) to inbox/duplicates and unreadable ones (or any that fail to build)
+    # to inbox/failed, with the error in a .error file next to them. The order
+    # lines and the workbook also go into the web app's caches under uploads_folder,
+    # so uploading the same report there is answered at once, and the order lines are
+    # recorded in the web app's ledger, so "only new" uploads leave them out.
+
+    def __init__(self, inbox, outbox, uploads_folder='uploads', interval=WATCH_INTERVAL, ledger_path=LEDGER_PATH):
+        self.inbox = inbox
+        self.outbox = outbox
+        self.interval = interval
+        self.result_cache = ResultCache(os.path.join(uploads_folder, 'cache'))
+        self.frame_cache = FrameCache(os.path.join(uploads_folder, 'frames'))
+        self.ledger = OrderLedger(ledger_path)
+        # path -> (size, mtime) seen on the previous scan
+        self._pending = {}
+        for folder in (inbox, outbox):
+            os.makedirs(folder, exist_ok=True)
+
+    def ready_reports(self):
+        # Reports whose size and mtime held still since the previous scan; files still
+        # being written (or Excel lock files) wait for the next one
+        seen = {}
+        ready = []
+        for entry in os.scandir(self.inbox):
+            name = entry.name
+            if not entry.is_file() or name.startswith(('.', '~$')) or not name.lower().endswith(REPORT_EXTENSIONS):
+                continue
+            stat = entry.stat()
+            signature = (stat.st_size, stat.st_mtime_ns)
+            if self._pending.get(entry.path) == signature and stat.st_size > 0:
+                ready.append(entry.path)
+            else:
+                seen[entry.path] = signature
+        self._pending = seen
+        return sorted(ready)
+
+    def move(self, path, folder):
+        # File a report away under an inbox subfolder, never overwriting an earlier one
+        target_dir = os.path.join(self.inbox, folder)
+        os.makedirs(target_dir, exist_ok=True)
+        target = os.path.join(target_dir, os.path.basename(path))
+        if os.path.exists(target):
+            stem, ext = os.path.splitext(os.path.basename(path))
+            target = os.path.join(target_dir, f"{stem}-{datetime.now().strftime('%Y%m%d%H%M%S%f')}{ext}")
+        shutil.move(path, target)
+        return target
+
+    def fail(self, path, error):
+        # File a report that could not be turned into a pick list, with a note of why
+        target = self.move(path, 'failed')
+        with open(f'{target}.error', 'w', encoding='utf-8') as f:
+            f.write(f"{error}\n")
+
+    def process(self, path):
+        # Reports over the streaming threshold are hashed and built in chunks, like large
+        # uploads to the web app, so memory stays bounded however large they are
+        from pick_list import build_pick_list
+        from pick_list_stream import build_pick_list_stream
+        from style_mapping import get_mappings
+
+        name = os.path.basename(path)
+        source_key = file_key(path)
+
+        index = read_index(self.outbox)
+        if source_key in index:
+            print(f"Skipping {name}: same report as {index[source_key]['report']}")
+            self.move(path, 'duplicates')
+            return None
+
+        started = time.perf_counter()
+        today = datetime.now().strftime("%Y%m%d")
+        output_name = f'{name} - Pick List.xlsx'
+        output_filepath = os.path.join(self.outbox, output_name)
+        tmp_path = f'{output_filepath}.{os.getpid()}.tmp'
+        try:
+            # The lines are recorded once the pick list is built
+            with self.ledger.run() as run:
+                if is_large_report(path):
+                    result = build_pick_list_stream(path, tmp_path, today, DEFAULT_GROUP_BY, DEFAULT_CONSOLIDATED,
+                                                    line_filter=run.add)
+                else:
+                    df = read_order_lines(path)
+                    self.frame_cache.put(source_key, df)
+                    result = build_pick_list(run.add(df), tmp_path, today, DEFAULT_GROUP_BY, DEFAULT_CONSOLIDATED)
+                os.replace(tmp_path, output_filepath)
+        except ReportFormatError as e:
+            print(f"Skipping {name}: {e}")
+            self.fail(path, e)
+            return None
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        key = cache_key(source_key, get_mappings().key, today, DEFAULT_GROUP_BY, DEFAULT_CONSOLIDATED)
+        self.result_cache.put(key, output_filepath)
+
+        result.update(report=name, output=output_name, created=time.time(),
+                      seconds=round(time.perf_counter() - started, 3))
+        index[source_key] = result
+        write_index(self.outbox, index)
+        self.move(path, 'processed')
+        print(f"Filed {output_name}: {result['order_lines']} order lines in {result['seconds']}s")
+        return result
+
+    def poll(self):
+        # One scan; returns how many reports were filed
+        filed = 0
+        for path in self.ready_reports():
+            try:
+                if self.process(path) is not None:
+                    filed += 1
+            except FileNotFoundError:
+                pass  # Moved away by someone else
+            except Exception as e:
+                # e.g. a corrupt workbook (BadZipFile); file it away so the next scan
+                # (or a restart) does not trip over it again, and go on with the rest
+                traceback.print_exc()
+                print(f"Could not build a pick list for {os.path.basename(path)}: {e!r}")
+                try:
+                    self.fail(path, f"{type(e).__name__}: {e}")
+                except OSError as move_error:
+                    print(f"Could not move {path} to failed: {move_error}")
+        return filed
+
+    def run(self):
+        print(f"Watching {os.path.abspath(self.inbox)} every {self.interval}s")
+        while True:
+            self.poll()
+            time.sleep(self.interval)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pre-build pick lists for reports dropped into an inbox folder")
+    parser.add_argument('--inbox', default=INBOX_FOLDER)
+    parser.add_argument('--outbox', default=OUTBOX_FOLDER)
+    parser.add_argument('--uploads', default='uploads', help="the web app's upload folder, for its caches")
+    parser.add_argument('--interval', type=float, default=WATCH_INTERVAL, help="seconds between scans")
+    parser.add_argument('--ledger', default=LEDGER_PATH, help="the web app's order line ledger")
+    args = parser.parse_args(argv)
+    InboxWatcher(args.inbox, args.outbox, args.uploads, args.interval, args.ledger).run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+import importlib.util
+import io
+import os
+
+from openpyxl import load_workbook
+
+APP_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURE = os.path.join(APP_FOLDER, 'uploads', 'testfile.xlsx')
+
+
+def load_app():
+    # Loaded from its path: the pick list app has a script.py of its own
+    spec = importlib.util.spec_from_file_location('vlookup_script', os.path.join(APP_FOLDER, 'script.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.app
+
+
+def upload(client, data, filename):
+    return client.post('/upload', data={'file': (io.BytesIO(data), filename)},
+                       content_type='multipart/form-data')
+
+
+def test_upload_of_sku_and_quantity_report():
+    # The fixture only has the sku and quantity-purchased columns
+    with open(FIXTURE, 'rb') as f:
+        data = f.read()
+    response = upload(load_app().test_client(), data, 'testfile.xlsx')
+    assert response.status_code == 200
+
+    wb = load_workbook(io.BytesIO(response.data), read_only=True)
+    rows = list(wb['Fx5-Format-Change'].iter_rows(values_only=True))
+    assert rows[0] == ('Style', 'Color', 'Size', 'Quantity')
+    # 296 order lines; the fixture's blank rows are skipped
+    assert len(rows) == 1 + 296
+
+
+def test_upload_without_sku_is_rejected():
+    response = upload(load_app().test_client(), b'order-id\tquantity-purchased\n1\t2\n', 'report.txt')
+    assert response.status_code == 400
+    assert b'missing columns: sku' in response.data